@@ -0,0 +1,183 @@
+import re
+import bisect
+import numpy as np
+
+# suffixes only need to be ordered by their first MAX_SEED_LENGTH tokens for seed lookups
+MAX_SEED_LENGTH = 32
+
+# seeds that occur more often than this are too common ("i don't know") to place a quote
+MAX_SEED_HITS = 50
+
+# how far apart two seed hits' diagonals may be and still belong to the same match,
+# this absorbs words the ASR or the LLM inserted or dropped
+DIAGONAL_BAND = 8
+
+
+# lowercases a word and strips punctuation so "Know," and "know" compare equal
+def normalize_token(word):
+    return re.sub(r"[^\w']+", '', word.lower())
+
+
+# suffix array over a token id array by prefix doubling, sorted on at most max_depth leading tokens
+def build_suffix_array(ids, max_depth=MAX_SEED_LENGTH):
+    n = len(ids)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    rank = np.unique(ids, return_inverse=True)[1].astype(np.int64)
+    suffix_array = np.argsort(rank, kind='stable')
+    k = 1
+
+    while k < max_depth and k < n:
+        # sort by (rank of the first k tokens, rank of the next k tokens), -1 past the end
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+        suffix_array = np.lexsort((second, rank))
+
+        sorted_rank = rank[suffix_array]
+        sorted_second = second[suffix_array]
+        changed = np.empty(n, dtype=bool)
+        changed[0] = True
+        changed[1:] = (sorted_rank[1:] != sorted_rank[:-1]) | (sorted_second[1:] != sorted_second[:-1])
+
+        rank = np.empty(n, dtype=np.int64)
+        rank[suffix_array] = np.cumsum(changed) - 1
+
+        # every suffix already has a distinct rank
+        if rank[suffix_array[-1]] == n - 1:
+            break
+        k *= 2
+
+    return suffix_array
+
+
+class QuoteAligner:
+    """
+    Finds where an LLM quote best matches a transcript, tolerating ASR and paraphrase errors.
+    Built once per transcript: words are normalized, interned to ids and indexed by a suffix array.
+    A quote is aligned by seed-and-extend. Each k-gram of the quote found in the suffix array
+    votes for a diagonal (transcript position minus quote position), rare seeds counting more,
+    and the best-supported diagonal is refined with a banded semi-global edit-distance alignment.
+    Query cost depends on the quote length and seed hits, not on the transcript length.
+    """
+
+    def __init__(self, words, seed_lengths=(3, 2, 1), max_seed_hits=MAX_SEED_HITS, band=DIAGONAL_BAND):
+        self.seed_lengths = seed_lengths
+        self.max_seed_hits = max_seed_hits
+        self.band = band
+
+        self.vocab_ids = {}
+        ids = []
+        for word in words:
+            token = normalize_token(word)
+            ids.append(self.vocab_ids.setdefault(token, len(self.vocab_ids)))
+
+        self.ids = ids
+        self.suffix_array = build_suffix_array(np.asarray(ids, dtype=np.int64)).tolist()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # positions in the transcript where the token id sequence occurs, via binary search on the suffix array
+    def occurrences(self, pattern):
+        pattern = tuple(pattern)
+        m = len(pattern)
+        ids = self.ids
+
+        def prefix(position):
+            return tuple(ids[position:position + m])
+
+        lo = bisect.bisect_left(self.suffix_array, pattern, key=prefix)
+        hi = bisect.bisect_right(self.suffix_array, pattern, lo=lo, key=prefix)
+        return self.suffix_array[lo:hi]
+
+    # seed hits as (diagonal, weight), trying shorter seeds only when longer ones find nothing
+    def _seed_hits(self, quote_ids):
+        for k in self.seed_lengths:
+            hits = []
+            for q in range(len(quote_ids) - k + 1):
+                seed = quote_ids[q:q + k]
+                if -1 in seed:
+                    continue
+                positions = self.occurrences(seed)
+                if not positions or len(positions) > self.max_seed_hits:
+                    continue
+                weight = k / len(positions)
+                hits.extend((position - q, weight) for position in positions)
+            if hits:
+                return hits
+        return []
+
+    # the diagonal whose neighbourhood of +/- band collects the most seed weight
+    def _best_diagonal(self, hits):
+        hits.sort()
+        best_diagonal, best_weight = None, 0.0
+        window_weight = 0.0
+        left = 0
+        for right in range(len(hits)):
+            window_weight += hits[right][1]
+            while hits[right][0] - hits[left][0] > 2 * self.band:
+                window_weight -= hits[left][1]
+                left += 1
+            if window_weight > best_weight:
+                best_weight = window_weight
+                # centre of the window, weighted by the seeds in it
+                window = hits[left:right + 1]
+                best_diagonal = round(sum(d * w for d, w in window) / window_weight)
+        return best_diagonal
+
+    # semi-global alignment of the quote inside transcript[lo:hi], returns (start, end, cost)
+    def _extend(self, quote_ids, lo, hi):
+        window = self.ids[lo:hi]
+        width = len(window)
+
+        # leading transcript words are free, each cell remembers where its alignment started
+        cost = [0] * (width + 1)
+        start = list(range(width + 1))
+
+        for token in quote_ids:
+            next_cost = [cost[0] + 1] + [0] * width
+            next_start = [start[0]] + [0] * width
+            for j in range(1, width + 1):
+                substitute = cost[j - 1] + (0 if window[j - 1] == token else 1)
+                skip_quote = cost[j] + 1
+                skip_transcript = next_cost[j - 1] + 1
+                if substitute <= skip_quote and substitute <= skip_transcript:
+                    next_cost[j], next_start[j] = substitute, start[j - 1]
+                elif skip_quote <= skip_transcript:
+                    next_cost[j], next_start[j] = skip_quote, start[j]
+                else:
+                    next_cost[j], next_start[j] = skip_transcript, next_start[j - 1]
+            cost, start = next_cost, next_start
+
+        # trailing transcript words are free too
+        end = min(range(1, width + 1), key=lambda j: (cost[j], j)) if width else 0
+        return lo + start[end], lo + end - 1, cost[end]
+
+    def align(self, quote, min_score=0.5):
+        """
+        Align a quote to the transcript. Returns {'start', 'end', 'score'} with inclusive
+        word positions and a score in [0, 1], or None if no sufficiently similar region exists.
+        """
+        # words that are pure punctuation normalize to nothing and are dropped, unknown words become -1
+        quote_tokens = [normalize_token(word) for word in quote.split()]
+        quote_ids = [self.vocab_ids.get(token, -1) for token in quote_tokens if token]
+        if not quote_ids or not self.ids:
+            return None
+
+        hits = self._seed_hits(quote_ids)
+        if not hits:
+            return None
+
+        diagonal = self._best_diagonal(hits)
+        lo = max(0, diagonal - self.band)
+        hi = min(len(self.ids), diagonal + len(quote_ids) + self.band)
+        if lo >= hi:
+            return None
+
+        start, end, cost = self._extend(quote_ids, lo, hi)
+        score = max(0.0, 1.0 - cost / len(quote_ids))
+        if score < min_score or end < start:
+            return None
+
+        return {'start': start, 'end': end, 'score': round(score, 3)}
@@ -3,19 +3,21 @@ import time
 import datetime
 import pandas as pd
 from preprocess import cut_video
-from queue_upload import upload_worker
-from queue import Queue
+from queue_upload import create_upload_queue, start_upload_pool, stop_upload_pool, load_upload_manifest, save_upload_manifest, \
+    segment_uploaded, segment_uri_for_audio
+from ingest import content_video_id
 import threading
 import os
 import uuid
 import boto3
 import json
 import io
+import contextlib
 from dotenv import load_dotenv
-import tempfile
-from cut_clip import extract_clips_from_s3
-from captions import add_captions_to_video, generate_srt_from_transcript, format_srt_time
-import subprocess
+from cut_clip import extract_clips_from_s3, open_source, smart_cut
+from workspace import job_workspace
+from delivery import show_download_link
+from captions import add_captions_to_video, burn_subtitles_into_video, generate_srt_from_transcript, format_srt_time
 
 
 load_dotenv()
@@ -131,7 +133,8 @@ s3_client = boto3.client(
     's3',
     aws_access_key_id=AWS_ACCESS_KEY,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
+    region_name=AWS_REGION,
+    endpoint_url=os.getenv('S3_ENDPOINT_URL')
 )
 
 def generate_video_for_best_segment(segment_data, source_video_uri, segment_index):
@@ -154,8 +157,8 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
     # Initialize progress
     progress_placeholder.progress(0)
     
-    # Parse the S3 URI
-    s3_parts = source_video_uri.split('://')
+    # Parse the S3 URI, transcripts made from an audio proxy are cut from its full-quality segment
+    s3_parts = segment_uri_for_audio(source_video_uri).split('://')
     if len(s3_parts) != 2:
         status_placeholder.error(f"Invalid S3 URI format: {source_video_uri}")
         return
@@ -170,6 +173,9 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
     
     status_placeholder.info(f"Processing video segment from S3: {s3_bucket}/{s3_key}")
     
+    # holds the job workspace and the source (a presigned URL or a pinned source cache entry) until the clip is done
+    job = contextlib.ExitStack()
+    
     try:
         # Create a list with the single segment we want to extract
         clips_to_extract = [{
@@ -185,52 +191,30 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
         st.session_state.video_generation_progress[source_video_uri] = progress
         progress_placeholder.progress(progress)
         
-        # First, download the original video
-        temp_dir = tempfile.gettempdir()
+        # every file of this clip lives in its own workspace, so concurrent generations never share a path
+        workspace = job.enter_context(job_workspace('clip'))
+        
+        # ffmpeg reads only the byte ranges it needs, or a local copy shared by every clip of this source
         video_id = os.path.basename(s3_key).split('.')[0]
-        original_video_path = os.path.join(temp_dir, f"{video_id}.mp4")
+        source_path = job.enter_context(open_source(s3_bucket, s3_key))
         
-        status_placeholder.info(f"Downloading original video from S3: {s3_bucket}/{s3_key}")
-        s3_client.download_file(
-            Bucket=s3_bucket,
-            Key=s3_key,
-            Filename=original_video_path
-        )
+        status_placeholder.info(f"Reading original video from S3: {s3_bucket}/{s3_key}")
         
-        # Update progress after download
+        # Update progress after opening the source
         progress = 0.3  # 30%
         st.session_state.video_generation_progress[source_video_uri] = progress
         progress_placeholder.progress(progress)
         
-        # Extract clip using MoviePy
+        # Extract clip, re-encoding only up to the first keyframe
         status_placeholder.info(f"Extracting clip from {start_time:.2f}s to {end_time:.2f}s...")
         
         # Generate unique filenames
         clip_filename = f"{video_id}_clip_{segment_index}_{start_time:.2f}-{end_time:.2f}.mp4"
-        clip_path = os.path.join(temp_dir, clip_filename)
+        clip_path = workspace.path(clip_filename)
         
-        from moviepy.editor import VideoFileClip
         try:
-            # Load the video
-            video = VideoFileClip(original_video_path)
-            
-            # Extract the subclip
-            subclip = video.subclip(start_time, end_time)
-            
-            # Write the clip to file
-            subclip.write_videofile(
-                clip_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile=os.path.join(temp_dir, "temp-audio.m4a"),
-                remove_temp=True,
-                fps=video.fps,
-                preset='fast'
-            )
-            
-            # Close clips to free memory
-            subclip.close()
-            video.close()
+            smart_cut(source_path, start_time, end_time, clip_path, workspace.root)
+            workspace.check_quota()
             
             # Update progress after extraction
             progress = 0.5  # 50%
@@ -267,14 +251,10 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
             # Now proceed with captioning
             status_placeholder.info("Creating caption file...")
             
-            # Create directories if they don't exist
-            os.makedirs("transcripts", exist_ok=True)
-            os.makedirs("captioned_videos", exist_ok=True)
-            
             # Create a simplified SRT file directly from the transcript text
             timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
             base_name = os.path.splitext(os.path.basename(clip_path))[0]
-            srt_path = os.path.join("transcripts", f"{base_name}_{timestamp}.srt")
+            srt_path = workspace.path(f"{base_name}.srt")
             
             # Create a simplified SRT file manually
             with open(srt_path, 'w', encoding='utf-8') as f:
@@ -319,38 +299,13 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
             
             # Add captions to the video using FFmpeg
             status_placeholder.info("Adding captions to the video...")
-            output_dir = "captioned_videos"
-            output_video_path = os.path.join(output_dir, f"{base_name}_captioned_{timestamp}.mp4")
-            
+            output_video_path = workspace.path(f"{base_name}_captioned_{timestamp}.mp4")
             
-            
-            # Convert Windows paths to properly escaped paths for FFmpeg
-            clip_path_fixed = clip_path.replace('\\', '/')
-            srt_path_fixed = srt_path.replace('\\', '/')
-            output_video_path_fixed = output_video_path.replace('\\', '/')
-            
-            # FFmpeg command with proper path escaping
-            cmd = [
-                'ffmpeg',
-                '-i', clip_path_fixed,
-                '-vf', f"subtitles='{srt_path_fixed}':force_style='FontName=Arial,FontSize=20,Bold=1,PrimaryColour=&H00FFFFFF,OutlineColour=&H50000000,BackColour=&H50000000,BorderStyle=1,Outline=1,Shadow=1,Alignment=10'",
-                '-c:a', 'copy',
-                '-y',
-                output_video_path_fixed
-            ]
-            
-            # Run the command
-            try:
-                result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                
-                if result.returncode != 0:
-                    status_placeholder.warning(f"Warning: FFmpeg error when adding captions. Using original clip instead.")
-                    captioned_video_path = clip_path
-                else:
-                    captioned_video_path = output_video_path
-                    
-            except Exception as e:
-                status_placeholder.warning(f"Warning: Could not add captions: {str(e)}. Using original clip instead.")
+            # Cut and caption straight from the source in one encode instead of re-encoding clip_path
+            if burn_subtitles_into_video(source_path, srt_path, output_video_path, start_time, end_time):
+                captioned_video_path = output_video_path
+            else:
+                status_placeholder.warning(f"Warning: FFmpeg error when adding captions. Using original clip instead.")
                 captioned_video_path = clip_path
             
             # Update progress
@@ -399,27 +354,10 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
             st.write(f"Original clip: {s3_clip_uri}")
             st.write(f"Captioned clip: {captioned_s3_uri}")
             
-            # Provide download button for the captioned video
+            # Link to the uploaded captioned clip, the browser downloads it straight from S3
             try:
-                with open(captioned_video_path, 'rb') as f:
-                    video_bytes = f.read()
-                    download_placeholder.download_button(
-                        label="Download Captioned Clip",
-                        data=io.BytesIO(video_bytes),
-                        file_name=captioned_filename,
-                        mime="video/mp4",
-                        key=f"download_captioned_segment_{segment_index}_{start_time:.2f}"
-                    )
-                    
-                # Clean up the temporary files
-                if os.path.exists(original_video_path):
-                    os.remove(original_video_path)
-                if os.path.exists(clip_path) and clip_path != captioned_video_path:
-                    os.remove(clip_path)
-                if os.path.exists(srt_path):
-                    os.remove(srt_path)
-                if os.path.exists(captioned_video_path):
-                    os.remove(captioned_video_path)
+                show_download_link(download_placeholder, captioned_s3_uri, "Download Captioned Clip",
+                                   captioned_filename)
                 
             except Exception as e:
                 download_placeholder.error(f"Could not prepare download: {str(e)}")
@@ -427,14 +365,15 @@ def generate_video_for_best_segment(segment_data, source_video_uri, segment_inde
                 
         except Exception as e:
             status_placeholder.error(f"Error processing video: {str(e)}")
-            if os.path.exists(original_video_path):
-                os.remove(original_video_path)
             raise e
             
     except Exception as e:
         status_placeholder.error(f"Error generating video: {str(e)}")
         progress_placeholder.progress(0)
         st.exception(e)
+    finally:
+        # removes the workspace and everything in it, and releases the source
+        job.close()
 
 def delete_best_segment(segment_data, source_video_uri, segment_index, json_key):
     """Delete a segment from the best segments list"""
@@ -648,36 +587,53 @@ def schedule_s3_fetch(delay_seconds=45):
 
 # Uploads the given file to s3 bucket
 def preprocess_and_upload(file):
-    # create an upload queue
-    upload_queue = Queue()
-    
-    # start the upload worker thread
-    upload_thread = threading.Thread(target=upload_worker, args=(upload_queue,))
-    upload_thread.start()
+    # derive the video ID from the file content so repeat submissions reuse the same S3 keys
+    video_id = content_video_id(file)
     
-    # generate a video ID
-    video_id = f"{uuid.uuid4()}"
+    # a manifest means every segment of this exact file was already cut and uploaded
+    if load_upload_manifest(video_id) is not None:
+        print(f"\nVideo {video_id} was already processed, skipping cut and upload")
+        schedule_s3_fetch(0)
+        return None, None
     
-    # create 5-minute segments and add them to the upload queue
-    segments = cut_video(
-        file, 
-        segment_length=300, 
-        upload_queue=upload_queue,
-        video_id=video_id
-    )
+    # create a bounded upload queue
+    upload_queue = create_upload_queue()
     
-    print(f"\nCreated {len(segments)} segments:")
-    for i, segment in enumerate(segments):
-        print(f"Segment {i}: {segment['file']} (Start: {segment['start_time']}s, Duration: {segment['duration']}s)")
+    # start the pool of upload workers
+    upload_threads = start_upload_pool(upload_queue)
     
-    print("\nWaiting for uploads to complete...")
-    upload_queue.join()
-    
-    upload_queue.put(None)
-    upload_thread.join()
+    # create 5-minute segments and add them to the upload queue
+    # the segments stay in the workspace until every upload is done, it has no quota since they add up to the source
+    try:
+        with job_workspace('ingest', quota_bytes=None) as workspace:
+            try:
+                segments = cut_video(
+                    file, 
+                    segment_length=300, 
+                    upload_queue=upload_queue,
+                    video_id=video_id,
+                    workspace=workspace
+                )
+            finally:
+                # the workers must be done with the segment files before the workspace is removed,
+                # and stopped even when cutting failed so they do not stay blocked on the queue
+                print("\nWaiting for uploads to complete...")
+                stop_upload_pool(upload_queue, upload_threads)
+            
+            print(f"\nCreated {len(segments)} segments:")
+            for i, segment in enumerate(segments):
+                print(f"Segment {i}: {segment['file']} (Start: {segment['start_time']}s, Duration: {segment['duration']}s)")
+    except Exception as e:
+        st.error(f"Could not process the video: {e}")
+        st.stop()
     
     print("\nAll segments have been uploaded to S3!")
     
+    # only record the video once every segment and its audio proxy made it to S3, otherwise the next
+    # submission would be skipped and a missing proxy never uploaded
+    if segments and all(segment_uploaded(segment) for segment in segments):
+        save_upload_manifest(video_id, segments)
+    
     # Schedule S3 fetch 45 seconds after upload completes
     schedule_s3_fetch(45)
     
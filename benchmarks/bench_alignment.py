@@ -0,0 +1,71 @@
+"""
+Benchmark for alignment.QuoteAligner: index build time and per-query time
+as the transcript grows. Query time should stay roughly flat (sub-linear)
+while build time grows with the transcript.
+
+Run from the repository root:
+    python benchmarks/bench_alignment.py
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alignment import QuoteAligner
+
+SIZES = [1_000, 10_000, 100_000]
+QUERIES = 200
+VOCAB_SIZE = 5_000
+
+
+# Zipf-like word stream, so common words repeat the way they do in speech
+def synthetic_words(count, rng):
+    vocab = [f"word{i}" for i in range(VOCAB_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCAB_SIZE)]
+    return rng.choices(vocab, weights, k=count)
+
+
+# a quote taken from the transcript with about 10% substitutions, insertions and deletions
+def noisy_quote(words, rng):
+    length = rng.randint(20, 120)
+    start = rng.randrange(0, len(words) - length)
+    quote = words[start:start + length]
+    for _ in range(length // 10):
+        position = rng.randrange(len(quote))
+        operation = rng.random()
+        if operation < 0.33:
+            quote[position] = 'unknownword'
+        elif operation < 0.66:
+            del quote[position]
+        else:
+            quote.insert(position, rng.choice(words))
+    return ' '.join(quote), start, start + length - 1
+
+
+def run():
+    rng = random.Random(0)
+    print(f"{'words':>8} {'build (s)':>10} {'query (ms)':>11} {'placed':>7}")
+
+    for size in SIZES:
+        words = synthetic_words(size, rng)
+
+        started = time.perf_counter()
+        aligner = QuoteAligner(words)
+        build_time = time.perf_counter() - started
+
+        queries = [noisy_quote(words, rng) for _ in range(QUERIES)]
+        placed = 0
+        started = time.perf_counter()
+        for quote, expected_start, expected_end in queries:
+            match = aligner.align(quote)
+            if match and abs(match['start'] - expected_start) <= 3 and abs(match['end'] - expected_end) <= 3:
+                placed += 1
+        query_time = (time.perf_counter() - started) / QUERIES
+
+        print(f"{size:>8} {build_time:>10.3f} {query_time * 1000:>11.2f} {placed / QUERIES:>7.0%}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,165 @@
+"""
+Benchmark for the cherrypick.py hot path with the LLM stubbed out: transcript parsing,
+alignment index build, n-gram lookup, quote alignment and the end-to-end extraction,
+on synthetic AWS Transcribe JSON of growing size. Each phase is timed on its own and
+then re-run under tracemalloc for its peak memory and the number of allocations
+still live when it returns. Results are written as JSON so runs from different
+versions can be diffed.
+
+Run from the repository root:
+    python benchmarks/bench_cherrypick.py --output bench_cherrypick.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import cherrypick
+from transcript import Transcript
+
+SIZES = [1_000, 10_000, 100_000, 500_000]
+VOCAB_SIZE = 5_000
+LOOKUPS = 1_000
+QUOTES = 5
+REPEATS = 3
+
+
+# AWS Transcribe-shaped JSON with a Zipf-like word stream and some punctuation
+def synthetic_transcript(count, rng):
+    vocab = [f"word{i}" for i in range(VOCAB_SIZE)]
+    weights = [1 / (rank + 1) for rank in range(VOCAB_SIZE)]
+    words = rng.choices(vocab, weights, k=count)
+
+    items = []
+    time_cursor = 0.0
+    for i, word in enumerate(words):
+        duration = rng.uniform(0.15, 0.5)
+        items.append({
+            'start_time': f"{time_cursor:.3f}",
+            'end_time': f"{time_cursor + duration:.3f}",
+            'alternatives': [{'confidence': f"{rng.uniform(0.7, 1.0):.4f}", 'content': word}],
+            'type': 'pronunciation'
+        })
+        time_cursor += duration + rng.uniform(0.0, 0.3)
+        if i % 12 == 11:
+            items.append({'alternatives': [{'confidence': '0.0', 'content': rng.choice('.,?!')}],
+                          'type': 'punctuation'})
+
+    return {
+        'jobName': f"synthetic-{count}",
+        'results': {'transcripts': [{'transcript': ' '.join(words)}], 'items': items},
+        'status': 'COMPLETED'
+    }, words
+
+
+# canned model response quoting QUOTES passages of about 40 seconds each
+def stub_response(words, rng):
+    segments = []
+    for n in range(QUOTES):
+        start = rng.randrange(0, max(len(words) - 120, 1))
+        segments.append(f"SEGMENT {n + 1}: {' '.join(words[start:start + 110])}")
+    return '\n\n'.join(segments)
+
+
+def phases(transcript_json, words, rng):
+    response = stub_response(words, rng)
+    index = cherrypick.index_transcript(transcript_json)
+    aligner = index['aligner']
+    patterns = []
+    for _ in range(LOOKUPS):
+        position = rng.randrange(0, max(len(aligner.ids) - 3, 1))
+        patterns.append(aligner.ids[position:position + 3])
+
+    def lookup():
+        for pattern in patterns:
+            aligner.occurrences(pattern)
+
+    def extract():
+        cherrypick.generate_clip_response = lambda *args, **kwargs: response
+        return cherrypick.extract_engaging_clips_ollama(transcript_json, use_cache=False)
+
+    return {
+        'parse': lambda: Transcript.from_aws_json(transcript_json),
+        'index': lambda: cherrypick.index_transcript(transcript_json),
+        'lookup': lookup,
+        'align': lambda: cherrypick.align_segments(cherrypick.parse_segments(response), index, 30, 60),
+        'end_to_end': extract,
+    }
+
+
+def measure(phase):
+    # best of REPEATS for the time, tracing is kept out of the timed runs since it slows allocation
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        phase()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    phase()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # tracemalloc only sees live blocks, so this counts allocations the phase left behind
+    allocations = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    return {
+        'seconds': min(timings),
+        'peak_bytes': peak,
+        'retained_allocations': allocations
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, output):
+    rng = random.Random(0)
+    original_generate = cherrypick.generate_clip_response
+    results = []
+    print(f"{'words':>8} {'phase':>11} {'time (s)':>9} {'peak (MB)':>10} {'retained':>9}")
+
+    try:
+        for size in sizes:
+            transcript_json, words = synthetic_transcript(size, rng)
+            for name, phase in phases(transcript_json, words, rng).items():
+                result = measure(phase)
+                results.append({'words': size, 'phase': name, **result})
+                print(f"{size:>8} {name:>11} {result['seconds']:>9.3f} "
+                      f"{result['peak_bytes'] / 1e6:>10.1f} {result['retained_allocations']:>9}")
+    finally:
+        cherrypick.generate_clip_response = original_generate
+
+    report = {
+        'benchmark': 'cherrypick',
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'results': results
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--output', default='bench_cherrypick.json')
+    args = parser.parse_args()
+    run(args.sizes, args.output)
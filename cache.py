@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from botocore.exceptions import ClientError
+
+
+# builds a cache key from any number of parts, e.g. (media hash, language, model)
+def make_cache_key(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Persistent JSON cache stored as one file per key, bounded by max_bytes.
+    Hits refresh the entry's mtime and eviction removes the least recently used
+    entries first. Entries older than ttl seconds (if set) are treated as misses.
+    When s3_bucket is set, entries are also written to S3 and local misses fall back to it.
+    """
+
+    def __init__(self, directory, max_bytes, ttl=None, s3_client=None, s3_bucket=None, s3_prefix=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.s3_client = s3_client
+        self.s3_bucket = s3_bucket
+        self.s3_prefix = s3_prefix
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    # entries are stored with their creation time so the TTL survives LRU mtime bumps
+    def _unwrap(self, entry):
+        if self.ttl is not None and time.time() - entry['created_at'] > self.ttl:
+            return None
+        return entry['value']
+
+    def get(self, key):
+        path = self._path(key)
+        with self.lock:
+            try:
+                with open(path, 'r') as f:
+                    value = self._unwrap(json.load(f))
+                if value is None:
+                    os.remove(path)
+                else:
+                    # mark as recently used
+                    os.utime(path, None)
+                    return value
+            except (OSError, ValueError, KeyError):
+                pass
+
+        if self.s3_bucket is None:
+            return None
+
+        try:
+            response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=f"{self.s3_prefix}{key}.json")
+            entry = json.loads(response['Body'].read().decode('utf-8'))
+            value = self._unwrap(entry)
+        except (ClientError, ValueError, KeyError):
+            return None
+        if value is None:
+            return None
+
+        # keep a local copy so the next lookup does not go to S3
+        self._write_local(key, entry)
+        return value
+
+    def put(self, key, value):
+        entry = {'created_at': time.time(), 'value': value}
+        self._write_local(key, entry)
+
+        if self.s3_bucket is not None:
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.s3_bucket,
+                    Key=f"{self.s3_prefix}{key}.json",
+                    Body=json.dumps(entry),
+                    ContentType='application/json'
+                )
+            except ClientError as e:
+                print(f"Could not write cache entry {key} to S3: {e}")
+
+    def _write_local(self, key, entry):
+        path = self._path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self.lock:
+            # write to a temp file first so readers never see a partial entry
+            with open(temp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, path)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        total_bytes = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_bytes += stat.st_size
+
+        # least recently used first
+        entries.sort()
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total_bytes -= size
+            except OSError:
+                pass
@@ -9,7 +9,14 @@ import datetime
 import subprocess
 from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
 import math
+import uuid
 from transcribe import transcribe_video
+from transcript import Transcript
+from cut_clip import ENCODE_ARGS, FFMPEG_QUIET_ARGS, redact_urls
+
+# caption style passed to the subtitles filter
+SUBTITLE_STYLE = ("FontName=Arial,FontSize=20,Bold=1,PrimaryColour=&H00FFFFFF,OutlineColour=&H50000000,"
+                  "BackColour=&H50000000,BorderStyle=1,Outline=1,Shadow=1,Alignment=10")
 
 # Load .env variables
 load_dotenv()
@@ -17,40 +24,54 @@ load_dotenv()
 AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
 
-def generate_srt_from_transcript(transcript_data, output_file):
+def generate_srt_from_transcript(transcript_data, output_file, start_time=None, end_time=None):
     """
-    Generate an SRT file from the transcript data
+    Generate an SRT file from the transcript data (AWS JSON or a Transcript)
+    When start_time/end_time are given, only the words in that window are captioned
+    and the times are shifted so the SRT starts at the clip's beginning
     """
-    items = transcript_data['results']['items']
+    transcript = Transcript.coerce(transcript_data)
+    
+    offset = 0.0
+    if start_time is not None:
+        transcript = transcript.slice_time(start_time, end_time if end_time is not None else float('inf'))
+        offset = start_time
+    
+    # pull the arrays into plain lists once instead of indexing numpy per item
+    contents = transcript.tokens()
+    starts = (transcript.start - offset).tolist()
+    ends = (transcript.end - offset).tolist()
+    punctuation = transcript.is_punctuation.tolist()
+    last_index = len(contents) - 1
     
     srt_lines = []
     current_caption = []
     caption_index = 1
-    start_time = None
+    caption_start = None
     
-    for item in items:
+    for i, content in enumerate(contents):
         # Skip non-speech elements like punctuation which don't have start_time
-        if 'start_time' not in item:
+        if punctuation[i]:
             if current_caption:  # Append punctuation to the current word if there is one
-                current_caption[-1] += item['alternatives'][0]['content']
+                current_caption[-1] += content
             continue
             
         # If this is the first word in a caption, record the start time
         if not current_caption:
-            start_time = float(item['start_time'])
+            caption_start = starts[i]
         
         # Add the word to the current caption
-        current_caption.append(item['alternatives'][0]['content'])
+        current_caption.append(content)
         
         # If we've reached ~10 words or there's a natural break (e.g., end of sentence),
         # or if this is the last word, then complete this caption
-        end_time = float(item['end_time'])
-        is_end_of_sentence = item['type'] == 'pronunciation' and item.get('alternatives')[0].get('content', '').endswith(('.', '!', '?'))
+        caption_end = ends[i]
+        is_end_of_sentence = content.endswith(('.', '!', '?'))
         
-        if len(current_caption) >= 10 or is_end_of_sentence or item == items[-1]:
+        if len(current_caption) >= 10 or is_end_of_sentence or i == last_index:
             # Format the times as required by SRT
-            start_str = format_srt_time(start_time)
-            end_str = format_srt_time(end_time)
+            start_str = format_srt_time(caption_start)
+            end_str = format_srt_time(caption_end)
             
             # Join the words into a caption text
             caption_text = ' '.join(current_caption)
@@ -64,7 +85,7 @@ def generate_srt_from_transcript(transcript_data, output_file):
             # Reset for the next caption
             current_caption = []
             caption_index += 1
-            start_time = None
+            caption_start = None
     
     # Write the SRT file
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -82,12 +103,16 @@ def format_srt_time(seconds):
     hours, minutes = divmod(minutes, 60)
     return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
 
-def burn_subtitles_into_video(video_path, srt_path, output_path):
+def burn_subtitles_into_video(video_path, srt_path, output_path, start_time=None, end_time=None):
     """
-    Burn SRT subtitles directly into the video using FFmpeg with proper path handling
+    Burn SRT subtitles directly into the video using FFmpeg with proper path handling.
+    With start_time/end_time the clip is cut from video_path (a file or URL) in the same
+    pass: ffmpeg seeks, trims, burns the subtitles and encodes once, so a captioned clip
+    never goes through a second, lossy encode. The SRT is then timed from the clip start.
     """
     # Ensure the output directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
     
     # Convert Windows paths to properly escaped paths for FFmpeg
     video_path_fixed = video_path.replace('\\', '/')
@@ -95,21 +120,33 @@ def burn_subtitles_into_video(video_path, srt_path, output_path):
     output_path_fixed = output_path.replace('\\', '/')
     
     # Print debugging info
-    print(f"Video path: {os.path.abspath(video_path)}")
+    # presigned URLs carry credentials in the query string, keep them out of the log
+    print(f"Video path: {video_path.split('?')[0]}")
     print(f"SRT path: {os.path.abspath(srt_path)}")
     print(f"Output path: {os.path.abspath(output_path)}")
     
+    # seeking on the input resets timestamps to the clip start, which is where the SRT is timed from
+    cmd = ['ffmpeg'] + FFMPEG_QUIET_ARGS
+    if start_time is not None:
+        cmd += ['-ss', str(start_time)]
+    cmd += ['-i', video_path_fixed]
+    if end_time is not None:
+        cmd += ['-t', str(end_time - (start_time or 0))]
+    
     # FFmpeg command with proper path escaping
-    cmd = [
-        'ffmpeg',
-        '-i', video_path_fixed,
-        '-vf', f"subtitles='{srt_path_fixed}':force_style='FontName=Arial,FontSize=20,Bold=1,PrimaryColour=&H00FFFFFF,OutlineColour=&H50000000,BackColour=&H50000000,BorderStyle=1,Outline=1,Shadow=1,Alignment=10'",
-        '-c:a', 'copy',
+    cmd += [
+        '-map', '0:v:0',
+        '-map', '0:a:0?',
+        '-vf', f"subtitles='{srt_path_fixed}':force_style='{SUBTITLE_STYLE}'",
+    ] + ENCODE_ARGS + [
+        # the audio is only copied when the whole input is used, a trimmed clip needs exact audio boundaries
+        '-c:a', 'copy' if start_time is None and end_time is None else 'aac',
+        '-movflags', '+faststart',
         '-y',
         output_path_fixed
     ]
     
-    print("Running FFmpeg command:", ' '.join(cmd))
+    print("Running FFmpeg command:", redact_urls(' '.join(cmd)))
     
     # Run the command
     try:
@@ -117,9 +154,9 @@ def burn_subtitles_into_video(video_path, srt_path, output_path):
         
         # Print FFmpeg output for debugging
         if result.stdout:
-            print("FFmpeg stdout:", result.stdout)
+            print("FFmpeg stdout:", redact_urls(result.stdout))
         if result.stderr:
-            print("FFmpeg stderr:", result.stderr)
+            print("FFmpeg stderr:", redact_urls(result.stderr))
             
         if result.returncode != 0:
             print(f"FFmpeg process returned non-zero exit code: {result.returncode}")
@@ -128,15 +165,18 @@ def burn_subtitles_into_video(video_path, srt_path, output_path):
         print(f"Successfully added captions to the video. Output saved to {output_path}")
         return output_path
     except Exception as e:
-        print(f"Error running FFmpeg: {e}")
+        print(f"Error running FFmpeg: {redact_urls(str(e))}")
         return None
 
-def add_captions_to_video(video_path, transcript_data):
+def add_captions_to_video(video_path, transcript_data, start_time=None, end_time=None, workspace=None):
     """
-    Main function to add captions to a video using FFmpeg only
+    Main function to add captions to a video using FFmpeg only.
+    With start_time/end_time the clip is cut from video_path and captioned in one encode.
+    With a workspace (see workspace.job_workspace) the SRT and the output are written into it,
+    otherwise into the shared transcripts/ and captioned_videos/ directories under unique names.
     """
-    # Verify the video file exists
-    if not os.path.exists(video_path):
+    # Verify the video file exists (URLs are left for ffmpeg to open)
+    if '://' not in video_path and not os.path.exists(video_path):
         print(f"ERROR: Video file not found at {video_path}")
         print(f"Current working directory: {os.getcwd()}")
         return {
@@ -145,20 +185,28 @@ def add_captions_to_video(video_path, transcript_data):
         }
     
     # Create output paths
-    base_name = os.path.splitext(os.path.basename(video_path))[0]
-    output_dir = "captioned_videos"
-    os.makedirs(output_dir, exist_ok=True)
-    
+    base_name = os.path.splitext(os.path.basename(video_path.split('?')[0]))[0]
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    srt_path = os.path.join("transcripts", f"{base_name}_{timestamp}.srt")
-    output_video_path = os.path.join(output_dir, f"{base_name}_captioned_{timestamp}.mp4")
+    
+    if workspace is not None:
+        srt_path = workspace.path(f"{base_name}.srt")
+        output_video_path = workspace.path(f"{base_name}_captioned_{timestamp}.mp4")
+    else:
+        # second-resolution timestamps collide between concurrent jobs, so names also get a random suffix
+        unique_name = f"{base_name}_{timestamp}_{uuid.uuid4().hex[:8]}"
+        os.makedirs("transcripts", exist_ok=True)
+        os.makedirs("captioned_videos", exist_ok=True)
+        srt_path = os.path.join("transcripts", f"{unique_name}.srt")
+        output_video_path = os.path.join("captioned_videos", f"{unique_name}_captioned.mp4")
     
     # Generate subtitle file
-    generate_srt_from_transcript(transcript_data, srt_path)
+    generate_srt_from_transcript(transcript_data, srt_path, start_time, end_time)
     print(f"Generated SRT file: {srt_path}")
     
     # Burn subtitles with FFmpeg
-    result = burn_subtitles_into_video(video_path, srt_path, output_video_path)
+    result = burn_subtitles_into_video(video_path, srt_path, output_video_path, start_time, end_time)
+    if workspace is not None:
+        workspace.check_quota()
     
     if result:
         return {
@@ -1,55 +1,323 @@
+import os
 import json
 import re
+import time
+import hashlib
+import logging
+import threading
 import requests
-from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from transcript import Transcript
+from alignment import QuoteAligner
+from cache import DiskCache, make_cache_key
+from heuristics import shortlist_text
+from ollama_client import get_default_client
 
-def extract_engaging_clips_ollama(transcript_json, num_clips=3, min_duration=30, max_duration=60, model="mistral"):
+logger = logging.getLogger(__name__)
+
+# bump whenever build_prompt changes so cached responses to the old prompt are not reused
+PROMPT_TEMPLATE_VERSION = 1
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+# model responses keyed by (model, prompt version, transcript hash, num_clips, min/max duration)
+# the cache directory is only created on first use, not on import
+def get_llm_cache():
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = DiskCache(
+                os.environ.get("LLM_CACHE_DIR", "llm_cache"),
+                max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+                ttl=int(os.environ.get("LLM_CACHE_TTL", 7 * 24 * 3600))
+            )
+        return _llm_cache
+
+def extract_engaging_clips_ollama(transcript_json, num_clips=3, min_duration=30, max_duration=60, model="mistral",
+                                  use_cache=True, prefilter_windows=None):
     """
-    Extract engaging clips from a transcript using Ollama model suggestions
-    with advanced n-gram matching for better timestamp extraction
+    Extract engaging clips from a transcript (AWS JSON or a Transcript) using Ollama model
+    suggestions, aligning each suggested quote to the transcript for its timestamps.
+    With prefilter_windows=K the model only sees the K best windows picked by the
+    heuristic pre-ranker instead of the full transcript.
     """
-    print("Starting clip extraction process...")
+    logger.info("Starting clip extraction process...")
+    
+    index = index_transcript(transcript_json)
+    clip_suggestions = select_clips(index, num_clips, min_duration, max_duration, model, use_cache, prefilter_windows)
+    if clip_suggestions is None:
+        return []
     
+    logger.info(f"Finished extracting clips. Found {len(clip_suggestions)} valid clips.")
+    return clip_suggestions
+
+# Asks the model for clips in an indexed transcript and aligns them, returns None if the model call failed
+def select_clips(index, num_clips, min_duration, max_duration, model, use_cache=True, prefilter_windows=None,
+                 timeout=60):
     # Extract the full transcript text
-    full_transcript = transcript_json['results']['transcripts'][0]['transcript']
-    print(f"Successfully extracted full transcript ({len(full_transcript)} characters)")
+    full_transcript = index['transcript'].full_text()
+    logger.debug(f"Successfully extracted full transcript ({len(full_transcript)} characters)")
     
-    # Get all word-level items with timestamps
-    word_items = [item for item in transcript_json['results']['items'] 
-                 if item['type'] == 'pronunciation']
-    print(f"Found {len(word_items)} word items with timestamps")
-    
-    # Build word index and n-gram indices
-    print("Building word and n-gram indices...")
-    word_index = defaultdict(list)
-    bigram_index = defaultdict(list)
-    trigram_index = defaultdict(list)
-    
-    # Create indices for faster lookup
-    for i in range(len(word_items)):
-        # Word index
-        word = word_items[i]['alternatives'][0]['content'].lower()
-        word_index[word].append(i)
-        
-        # Bigram index (pairs of words)
-        if i < len(word_items) - 1:
-            next_word = word_items[i+1]['alternatives'][0]['content'].lower()
-            bigram = (word, next_word)
-            bigram_index[bigram].append(i)
+    # Only send the heuristically shortlisted windows to the model
+    if prefilter_windows:
+        full_transcript = shortlist_text(index['transcript'], prefilter_windows, min_duration, max_duration)
+        logger.info(f"Shortlisted {prefilter_windows} windows for the prompt ({len(full_transcript)} characters)")
+    
+    ai_response = generate_clip_response(full_transcript, num_clips, min_duration, max_duration, model,
+                                         timeout, use_cache)
+    if ai_response is None:
+        return None
+    
+    suggested_segments = parse_segments(ai_response)
+    return align_segments(suggested_segments, index, min_duration, max_duration)
+
+# Batch mode for many transcripts, e.g. every segment of a video or a backlog of videos
+def extract_clips_batch(transcripts, num_clips=3, min_duration=30, max_duration=60, model="mistral",
+                        index_workers=2, llm_workers=2, max_pending=8, timeout=120, use_cache=True,
+                        prefilter_windows=None):
+    """
+    Select clips for every transcript in an iterable, yielding one record per transcript as it finishes:
+    {'position', 'clips', 'error', 'index_seconds', 'select_seconds'}, where position is the transcript's
+    place in the input. Indexing runs on its own thread pool and feeds a second pool that calls the model
+    and aligns, so CPU-bound indexing of the next transcripts overlaps generation for the current ones.
+    At most max_pending transcripts are in the pipeline at once, so the input can be a lazy generator.
+    """
+    
+    def index_one(transcript_json):
+        started = time.perf_counter()
+        return index_transcript(transcript_json), time.perf_counter() - started
+    
+    def select_one(index):
+        started = time.perf_counter()
+        clips = select_clips(index, num_clips, min_duration, max_duration, model, use_cache, prefilter_windows,
+                             timeout)
+        return clips, time.perf_counter() - started
+    
+    inputs = enumerate(transcripts)
+    stages = {}
+    index_seconds = {}
+    
+    with ThreadPoolExecutor(max_workers=index_workers) as indexers, \
+            ThreadPoolExecutor(max_workers=llm_workers) as selectors:
+        while True:
+            # keep the pipeline topped up from the input
+            while len(stages) < max_pending:
+                try:
+                    position, transcript_json = next(inputs)
+                except StopIteration:
+                    break
+                stages[indexers.submit(index_one, transcript_json)] = ('index', position)
+            
+            if not stages:
+                break
             
-        # Trigram index (triplets of words)
-        if i < len(word_items) - 2:
-            next_word = word_items[i+1]['alternatives'][0]['content'].lower() 
-            next_next_word = word_items[i+2]['alternatives'][0]['content'].lower()
-            trigram = (word, next_word, next_next_word)
-            trigram_index[trigram].append(i)
-    
-    print(f"Created index with {len(word_index)} unique words")
-    print(f"Created index with {len(bigram_index)} unique bigrams")
-    print(f"Created index with {len(trigram_index)} unique trigrams")
-    
-    # Create prompt for the Ollama model
+            done, _ = wait(stages, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, position = stages.pop(future)
+                record = {'position': position, 'clips': [], 'error': None,
+                          'index_seconds': index_seconds.get(position), 'select_seconds': None}
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    logger.exception(f"Clip selection failed for transcript {position} during {stage}")
+                    record['error'] = f"{stage} failed: {e}"
+                    index_seconds.pop(position, None)
+                    yield record
+                    continue
+                
+                if stage == 'index':
+                    index_seconds[position] = seconds
+                    stages[selectors.submit(select_one, result)] = ('select', position)
+                    continue
+                
+                index_seconds.pop(position, None)
+                record['select_seconds'] = seconds
+                if result is None:
+                    record['error'] = "model call failed"
+                else:
+                    record['clips'] = result
+                logger.info(f"Transcript {position}: {len(record['clips'])} clips")
+                yield record
+
+# Streaming mode: yields each clip as soon as its SEGMENT block has been generated and aligned
+def iter_engaging_clips_ollama(transcript_json, num_clips=3, min_duration=30, max_duration=60, model="mistral",
+                               timeout=120, use_cache=True):
+    """
+    Generator version of extract_engaging_clips_ollama. The model response is read as an NDJSON
+    token stream and every completed SEGMENT block is aligned right away, so the first clip is
+    available seconds after generation starts instead of after the whole response.
+    """
+    index = index_transcript(transcript_json)
+    full_transcript = index['transcript'].full_text()
+    
+    cache_key = clip_response_cache_key(full_transcript, num_clips, min_duration, max_duration, model)
+    cached = get_llm_cache().get(cache_key) if use_cache else None
+    if cached is not None:
+        logger.info(f"Using cached Ollama response ({len(cached)} characters)")
+        for clip in align_segments(parse_segments(cached), index, min_duration, max_duration):
+            yield clip
+        return
+    
+    prompt = build_prompt(full_transcript, num_clips, min_duration, max_duration)
+    response_parts = []
+    
+    def record(text_chunks):
+        for text in text_chunks:
+            response_parts.append(text)
+            yield text
+    
+    try:
+        for block in iter_segment_blocks(record(stream_ollama(prompt, model, timeout))):
+            for clip in align_segments([block], index, min_duration, max_duration):
+                yield clip
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to stream from Ollama API: {e}")
+        return
+    
+    # only a complete response is cached
+    if use_cache:
+        get_llm_cache().put(cache_key, ''.join(response_parts))
+
+# Map-reduce mode for transcripts too long to fit in one prompt
+def extract_engaging_clips_chunked(transcript_json, num_clips=3, min_duration=30, max_duration=60, model="mistral",
+                                   window_seconds=600, overlap_seconds=90, clips_per_window=2, max_workers=2,
+                                   timeout=120, use_cache=True):
+    """
+    Split the transcript into overlapping time windows, ask the model for candidate clips in each
+    window concurrently (at most max_workers windows in flight, the shared Ollama client
+    further caps concurrent requests at OLLAMA_MAX_CONCURRENCY),
+    then reduce the candidates to the best num_clips with one short ranking prompt.
+    Latency grows with windows / max_workers instead of with the transcript length.
+    """
+    logger.info("Starting chunked clip extraction process...")
+    
+    index = index_transcript(transcript_json)
+    windows = split_windows(index['transcript'], window_seconds, overlap_seconds)
+    logger.info(f"Split transcript into {len(windows)} overlapping windows")
+    
+    # Map: each window is prompted on its own, quotes are still aligned against the whole transcript
+    def score_window(window_text):
+        ai_response = generate_clip_response(window_text, clips_per_window, min_duration, max_duration, model,
+                                             timeout, use_cache)
+        if ai_response is None:
+            return []
+        return align_segments(parse_segments(ai_response), index, min_duration, max_duration)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        candidates = [clip for clips in executor.map(score_window, windows) for clip in clips]
+    
+    # Overlapping windows can suggest the same moment twice
+    candidates = remove_overlapping_clips(candidates)
+    logger.info(f"Collected {len(candidates)} candidate clips from all windows")
+    
+    # Reduce: pick the best clips across all windows
+    clip_suggestions = reduce_candidates(candidates, num_clips, model, timeout)
+    logger.info(f"Finished extracting clips. Found {len(clip_suggestions)} valid clips.")
+    return clip_suggestions
+
+# Splits a transcript into overlapping windows of text, window_seconds long and overlap_seconds apart from the next
+def split_windows(transcript, window_seconds, overlap_seconds):
+    if len(transcript) == 0:
+        return []
+    
+    step = max(window_seconds - overlap_seconds, 1)
+    first_time = float(transcript.start[0])
+    last_time = float(transcript.end[-1])
+    
+    windows = []
+    window_start = first_time
+    while True:
+        window = transcript.slice_time(window_start, window_start + window_seconds)
+        if len(window):
+            windows.append(window.text_between(0, len(window)))
+        if window_start + window_seconds >= last_time:
+            break
+        window_start += step
+    return windows
+
+# Keeps the most confident clip out of any group overlapping by more than half of the shorter one
+def remove_overlapping_clips(clips, max_overlap=0.5):
+    kept = []
+    for clip in sorted(clips, key=lambda c: c['confidence'], reverse=True):
+        overlaps = False
+        for other in kept:
+            overlap = min(clip['end_time'], other['end_time']) - max(clip['start_time'], other['start_time'])
+            if overlap > max_overlap * min(clip['duration'], other['duration']):
+                overlaps = True
+                break
+        if not overlaps:
+            kept.append(clip)
+    return kept
+
+# Final pass: asks the model to rank the candidates, falling back to alignment confidence
+def reduce_candidates(candidates, num_clips, model, timeout=60):
+    by_confidence = sorted(candidates, key=lambda c: c['confidence'], reverse=True)
+    if len(candidates) <= num_clips:
+        return by_confidence
+    
+    candidate_lines = "\n".join(
+        f"CANDIDATE {i+1} ({clip['start_time']:.1f}s - {clip['end_time']:.1f}s): {clip['transcript']}"
+        for i, clip in enumerate(candidates)
+    )
     prompt = f"""
+    Below are candidate clips taken from different parts of one long video.
+    Choose the {num_clips} that would make the most engaging standalone clips for Tiktok.
+    
+    Respond with only their numbers, best first, formatted as:
+    
+    BEST: n, n, n
+    
+    {candidate_lines}
+    """
+    
+    ai_response = call_ollama(prompt, model, timeout)
+    if ai_response is None or 'BEST:' not in ai_response:
+        return by_confidence[:num_clips]
+    
+    chosen = []
+    for number in re.findall(r'\d+', ai_response.split('BEST:', 1)[1]):
+        position = int(number) - 1
+        if 0 <= position < len(candidates) and candidates[position] not in chosen:
+            chosen.append(candidates[position])
+        if len(chosen) == num_clips:
+            break
+    
+    # top up with the most confident remaining candidates if the model listed too few
+    for clip in by_confidence:
+        if len(chosen) == num_clips:
+            break
+        if clip not in chosen:
+            chosen.append(clip)
+    return chosen
+
+# Parses the transcript once and builds everything the alignment step needs
+def index_transcript(transcript_json):
+    # Parse the transcript once into arrays
+    transcript = Transcript.coerce(transcript_json)
+    
+    # Get all word-level items with timestamps
+    words = transcript.words_only()
+    word_texts = words.tokens()
+    logger.debug(f"Found {len(word_texts)} word items with timestamps")
+    
+    # Build the alignment index (suffix array over the word ids) once per transcript
+    logger.debug("Building alignment index...")
+    aligner = QuoteAligner(word_texts)
+    logger.debug(f"Created alignment index over {len(aligner)} words")
+    
+    return {
+        'transcript': transcript,
+        'words': words,
+        'word_texts': word_texts,
+        'word_starts': words.start.tolist(),
+        'word_ends': words.end.tolist(),
+        'aligner': aligner
+    }
+
+# Create prompt for the Ollama model
+def build_prompt(full_transcript, num_clips, min_duration, max_duration):
+    return f"""
     Below is a transcript from a video. Identify the {num_clips} most engaging, 
     interesting, or meaningful segments (at least {min_duration} - {max_duration} seconds) that would make excellent clips for Tiktok (WITH ENOUGHT CONTEXT TO UNDERSTAND THE WORDS).
     
@@ -67,159 +335,177 @@ def extract_engaging_clips_ollama(transcript_json, num_clips=3, min_duration=30,
     Transcript:
     {full_transcript}
     """
+
+# Cache key for a clip-selection response
+def clip_response_cache_key(transcript_text, num_clips, min_duration, max_duration, model):
+    transcript_hash = hashlib.sha256(transcript_text.encode('utf-8')).hexdigest()
+    return make_cache_key(model, PROMPT_TEMPLATE_VERSION, transcript_hash, num_clips, min_duration, max_duration)
+
+# Returns the model's SEGMENT response for a transcript, from the response cache when the same
+# transcript was already sent with the same model, prompt version and clip parameters
+def generate_clip_response(transcript_text, num_clips, min_duration, max_duration, model, timeout=60, use_cache=True):
+    cache_key = clip_response_cache_key(transcript_text, num_clips, min_duration, max_duration, model)
+    
+    if use_cache:
+        cached = get_llm_cache().get(cache_key)
+        if cached is not None:
+            logger.info(f"Using cached Ollama response ({len(cached)} characters)")
+            return cached
     
-    print(f"Calling Ollama API with model: {model}")
+    prompt = build_prompt(transcript_text, num_clips, min_duration, max_duration)
+    ai_response = call_ollama(prompt, model, timeout)
+    
+    # failed calls are not cached so they are retried next time
+    if ai_response is not None and use_cache:
+        get_llm_cache().put(cache_key, ai_response)
+    return ai_response
+
+# Calls the Ollama API and returns the response text, or None if the call failed
+def call_ollama(prompt, model, timeout=60):
+    logger.debug(f"Calling Ollama API with model: {model}")
     try:
-        response = requests.post(
-            'http://localhost:11434/api/generate',
-            json={
-                'model': model,
-                'prompt': prompt,
-                'stream': False
-            },
-            timeout=60
-        )
-        response.raise_for_status()
-        ai_response = response.json().get('response', '')
-        print(f"Received response from Ollama ({len(ai_response)} characters)")
-        print("Response:", ai_response) 
+        ai_response = get_default_client().generate(prompt, model, timeout)
+        logger.debug(f"Received response from Ollama ({len(ai_response)} characters)")
+        logger.debug(f"Response: {ai_response}")
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Failed to call Ollama API: {e}")
-        return []
+        logger.error(f"Failed to call Ollama API: {e}")
+        return None
+    
+    return ai_response
+
+# Calls the Ollama API in streaming mode and yields the response text as it is generated
+def stream_ollama(prompt, model, timeout=60):
+    logger.debug(f"Streaming from Ollama API with model: {model}")
+    yield from get_default_client().stream_generate(prompt, model, timeout)
+
+# Yields each SEGMENT block from a stream of response text as soon as it is complete,
+# a block is complete once the next SEGMENT header (or the end of the stream) arrives
+def iter_segment_blocks(text_chunks):
+    header = re.compile(r'SEGMENT \d+:')
+    buffer = ''
     
+    for text in text_chunks:
+        buffer += text
+        headers = list(header.finditer(buffer))
+        if len(headers) < 2:
+            continue
+        
+        for current, following in zip(headers, headers[1:]):
+            block = clean_segment(buffer[current.end():following.start()])
+            if block:
+                yield block
+        buffer = buffer[headers[-1].start():]
+    
+    match = header.search(buffer)
+    if match:
+        block = clean_segment(buffer[match.end():])
+        if block:
+            yield block
+
+# Extracts the SEGMENT n: quotes from a model response
+def parse_segments(ai_response):
     # Extract the suggested segments
     segment_matches = re.findall(r'SEGMENT \d+: (.*?)(?=SEGMENT \d+:|$)', ai_response, re.DOTALL)
     suggested_segments = [segment.strip() for segment in segment_matches if segment.strip()]
     
     # Remove any quotation marks from the beginning and end of segments
-    cleaned_segments = []
-    for segment in suggested_segments:
-        # Remove leading/trailing quotes if present
-        cleaned = segment
-        if cleaned.startswith('"') and cleaned.endswith('"'):
-            cleaned = cleaned[1:-1].strip()
-        elif cleaned.startswith('"'):
-            cleaned = cleaned[1:].strip()
-        elif cleaned.endswith('"'):
-            cleaned = cleaned[:-1].strip()
-        cleaned_segments.append(cleaned)
-    
-    suggested_segments = cleaned_segments
-    print(f"Found {len(suggested_segments)} suggested segments")
-    
-    # Map suggested segments to timestamps
-    print("Mapping segments to timestamps...")
+    cleaned_segments = [clean_segment(segment) for segment in suggested_segments]
+    
+    logger.debug(f"Found {len(cleaned_segments)} suggested segments")
+    return cleaned_segments
+
+# Removes leading/trailing quotes from a suggested segment if present
+def clean_segment(segment):
+    cleaned = segment.strip()
+    if cleaned.startswith('"') and cleaned.endswith('"'):
+        cleaned = cleaned[1:-1].strip()
+    elif cleaned.startswith('"'):
+        cleaned = cleaned[1:].strip()
+    elif cleaned.endswith('"'):
+        cleaned = cleaned[:-1].strip()
+    return cleaned
+
+# Map suggested segments to timestamps
+def align_segments(suggested_segments, index, min_duration, max_duration):
+    words = index['words']
+    word_texts = index['word_texts']
+    word_starts = index['word_starts']
+    word_ends = index['word_ends']
+    aligner = index['aligner']
+    
+    logger.debug("Mapping segments to timestamps...")
     clip_suggestions = []
     
     for segment_idx, segment_text in enumerate(suggested_segments):
-        print(f"\nProcessing segment {segment_idx+1}...")
+        logger.debug(f"Processing segment {segment_idx+1}...")
         
         # Get the words from the segment
-        segment_words = [word.lower() for word in segment_text.split()]
+        segment_words = segment_text.split()
         
         if len(segment_words) < 3:
-            print(f"Segment too short: '{segment_text}'")
+            logger.debug(f"Segment too short: '{segment_text}'")
             continue
             
-        # Try to find the start position using trigrams first (most accurate)
-        start_pos = find_position_with_ngrams(segment_words[:5], trigram_index, 3)
+        # Align the whole quote, tolerating words the ASR or the model got wrong
+        match = aligner.align(segment_text)
+        end_pos = None
         
-        # If trigram matching failed, try bigrams
-        if start_pos is None:
-            start_pos = find_position_with_ngrams(segment_words[:5], bigram_index, 2)
-            
-        # If bigram matching failed, try individual words
-        if start_pos is None:
-            # Try to find positions of first few words
-            candidate_positions = []
-            for word in segment_words[:3]:  # Try first 3 words
-                if word in word_index and len(word) > 3:  # Only use substantial words
-                    candidate_positions.extend(word_index[word])
-                    
-            if candidate_positions:
-                # Take the earliest position that has several matches nearby
-                candidate_positions.sort()
-                start_pos = candidate_positions[0]
-                print(f"Found approximate start with single word matching at position {start_pos}")
-        
-        # If all attempts to find start position failed
-        if start_pos is None:
-            print(f"Could not find start position for segment: '{segment_text[:50]}...'")
-            continue
+        if match is not None:
+            start_pos, end_pos, match_score = match['start'], match['end'], match['score']
+            logger.debug(f"Aligned segment to positions {start_pos}-{end_pos} (score {match_score:.2f})")
+        else:
+            # The quote as a whole is too far from the transcript, try to place just its opening words
+            opening = aligner.align(' '.join(segment_words[:8]))
+            if opening is None:
+                logger.warning(f"Could not find start position for segment: '{segment_text[:50]}...'")
+                continue
+            start_pos, match_score = opening['start'], opening['score'] / 2
+            logger.debug(f"Found approximate start from the opening words at position {start_pos}")
             
         # Get the start time from the position
-        start_time = float(word_items[start_pos]['start_time'])
-        print(f"Found start time: {start_time}s at position {start_pos}")
-        
-        # Try to find the end position using trigrams first (most accurate)
-        end_words = segment_words[-5:] if len(segment_words) >= 5 else segment_words
-        end_pos = find_position_with_ngrams(end_words, trigram_index, 3, find_last=True)
+        start_time = word_starts[start_pos]
+        logger.debug(f"Found start time: {start_time}s at position {start_pos}")
         
-        # If trigram matching failed, try bigrams
-        if end_pos is None:
-            end_pos = find_position_with_ngrams(end_words, bigram_index, 2, find_last=True)
-            
-        # If bigram matching failed, try individual words
-        if end_pos is None:
-            # Try to find positions of last few words
-            candidate_positions = []
-            for word in reversed(end_words):  # Try last few words
-                if word in word_index and len(word) > 3:  # Only use substantial words
-                    candidate_positions.extend(word_index[word])
-                    
-            if candidate_positions:
-                # Take the latest position
-                candidate_positions.sort(reverse=True)
-                end_pos = min(candidate_positions[0] + 1, len(word_items) - 1)  # +1 to include the last word
-                print(f"Found approximate end with single word matching at position {end_pos}")
-        
-        # If we still couldn't find the end position, estimate based on start time and desired duration
+        # If we couldn't find the end position, estimate based on start time and desired duration
         if end_pos is None:
             # Look for a word position approximately 45 seconds after start
             target_time = start_time + 45  # Target middle of min_duration and max_duration
-            closest_pos = start_pos
-            min_diff = float('inf')
             
-            # Search for the closest word to our target time
-            for i in range(start_pos + 1, len(word_items)):
-                time_diff = abs(float(word_items[i]['start_time']) - target_time)
-                if time_diff < min_diff:
-                    min_diff = time_diff
-                    closest_pos = i
+            # Binary search for the closest word to our target time
+            closest_pos = words.nearest_word(target_time, lo=start_pos + 1)
+            if closest_pos is None:
+                closest_pos = start_pos
                     
             end_pos = closest_pos
-            print(f"Estimated end position based on desired duration: {end_pos}")
+            logger.debug(f"Estimated end position based on desired duration: {end_pos}")
         
         # Get the end time from the position
-        end_time = float(word_items[end_pos]['end_time'])
-        print(f"Found end time: {end_time}s at position {end_pos}")
+        end_time = word_ends[end_pos]
+        logger.debug(f"Found end time: {end_time}s at position {end_pos}")
         
         # Ensure end time is after start time
         if end_time <= start_time:
-            print(f"WARNING: End time ({end_time}s) is before or equal to start time ({start_time}s)")
+            logger.warning(f"End time ({end_time}s) is before or equal to start time ({start_time}s)")
             continue
             
         duration = end_time - start_time
-        print(f"Clip duration: {duration:.2f}s")
+        logger.debug(f"Clip duration: {duration:.2f}s")
         
         # Calculate a confidence score based on match quality and duration appropriateness
-        confidence_score = 0.8  # Base confidence
+        confidence_score = 0.8 * match_score  # Base confidence scaled by alignment quality
         
         # Factor in duration appropriateness (without adjusting the duration)
         if duration < min_duration:
             confidence_score *= (duration / min_duration)
-            print(f"Duration below minimum ({min_duration}s), reducing confidence")
+            logger.debug(f"Duration below minimum ({min_duration}s), reducing confidence")
         elif duration > max_duration:
             confidence_score *= (max_duration / duration)
-            print(f"Duration above maximum ({max_duration}s), reducing confidence")
+            logger.debug(f"Duration above maximum ({max_duration}s), reducing confidence")
         
-        # Extract the actual transcript text from word_items for better accuracy
-        actual_transcript = " ".join([
-            word_items[i]['alternatives'][0]['content']
-            for i in range(start_pos, end_pos + 1)
-        ])
+        # Extract the actual transcript text from the words for better accuracy
+        actual_transcript = " ".join(word_texts[start_pos:end_pos + 1])
         
-        print(f"Adding clip: {start_time:.2f}s - {end_time:.2f}s (Duration: {duration:.2f}s)")
+        logger.debug(f"Adding clip: {start_time:.2f}s - {end_time:.2f}s (Duration: {duration:.2f}s)")
         clip_suggestions.append({
             'start_time': round(start_time, 2),
             'end_time': round(end_time, 2),
@@ -228,44 +514,12 @@ def extract_engaging_clips_ollama(transcript_json, num_clips=3, min_duration=30,
             'confidence': round(confidence_score, 2)
         })
     
-    print(f"Finished extracting clips. Found {len(clip_suggestions)} valid clips.")
     return clip_suggestions
 
-# Find position in transcript using n-grams and return position found
-# words: List of words to match
-# ngram_index: Index of n-grams mapping to positions
-# n: Size of n-gram (2 for bigrams, 3 for trigrams)
-# find_last: Whether to find the last occurrence (for end position)
-def find_position_with_ngrams(words, ngram_index, n, find_last=False):
-    if len(words) < n:
-        return None
-        
-    positions = []
-    
-    # Try each possible n-gram from the words
-    for i in range(len(words) - n + 1):
-        ngram = tuple(words[i:i+n])
-        if ngram in ngram_index:
-            # Found a match
-            if find_last:
-                # For end position, take the last occurrence
-                positions.extend(ngram_index[ngram])
-            else:
-                # For start position, prefer earlier occurrences
-                positions.extend(ngram_index[ngram])
-    
-    if positions:
-        if find_last:
-            # For end position, take the last occurrence plus offset to include all matched words
-            return max(positions) + (n - 1)  # Add offset for n-gram length
-        else:
-            # For start position, take the earliest occurrence
-            return min(positions)
-    
-    return None
-
 # Example usage
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    
     # Load the transcription JSON
     try:
         with open('transcripts\segment_000_20250414002344.json', 'r') as file:
@@ -1,107 +1,352 @@
 import boto3
 import os
-import uuid
+import re
 import json
-from moviepy.editor import VideoFileClip
+import subprocess
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from source_cache import get_source_cache
+from workspace import job_workspace
 
 load_dotenv()
 
 AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
-s3_client = boto3.client('s3', region_name='us-east-1', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
+# set to point at a local S3 stand-in (e.g. MinIO) instead of AWS
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")
+s3_client = boto3.client('s3', region_name='us-east-1', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                         endpoint_url=S3_ENDPOINT_URL)
 
-def extract_clips_from_s3(clips, s3_key, bucket_name="uploaded-clips", output_bucket="clip-farm-results"):
+# how long a presigned source URL stays valid, long enough for every ffmpeg pass over one clip batch
+SOURCE_URL_EXPIRES = 3600
+
+# read sources over ranged HTTP by default, set to 0 to use whole local copies from the source cache
+SOURCE_RANGE_READ = os.environ.get("SOURCE_RANGE_READ", "1") != "0"
+
+# x264 profile names for the profiles ffprobe reports, the head of a smart cut is encoded with the source's profile
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high',
+}
+
+# pixel formats the re-encoded head can match exactly
+SMART_CUT_PIX_FMTS = {'yuv420p', 'yuvj420p'}
+
+# encoder settings for re-encoded video, shared by the smart-cut head and the full encode
+ENCODE_ARGS = ['-c:v', 'libx264', '-preset', 'fast', '-crf', '18']
+
+# ENCODE_ARGS capped at threads encoder threads, parallel jobs split the cores instead of
+# each starting one x264 thread per core
+def encode_args(threads=None):
+    return ENCODE_ARGS + (['-threads', str(threads)] if threads else [])
+
+# ffmpeg prints its input URL in banners and HTTP errors, quiet flags for every run on a presigned source
+FFMPEG_QUIET_ARGS = ['-hide_banner', '-v', 'error']
+
+# strips query strings from URLs in ffmpeg output, presigned URLs carry credentials and signatures there
+def redact_urls(text):
+    return re.sub(r"(\w+://[^\s'\"?]*)\?[^\s'\"]*", r"\1?<redacted>", text)
+
+# how far a smart cut's video and container durations may drift from the requested clip length
+SMART_CUT_DURATION_TOLERANCE = 0.5
+
+
+# presigned GET URL for a source object, ffmpeg and ffprobe read it with HTTP range requests:
+# the moov index first, then only the byte ranges around each seek, so the transfer scales
+# with the clip length instead of the source length
+def presigned_source_url(bucket_name, s3_key, expires=SOURCE_URL_EXPIRES):
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket_name, 'Key': s3_key},
+        ExpiresIn=expires
+    )
+
+# yields something ffmpeg can open for a source object: a presigned URL for range reads,
+# or a local copy from the shared source cache that stays in place until the block exits
+@contextmanager
+def open_source(bucket_name, s3_key, range_read=SOURCE_RANGE_READ):
+    if range_read:
+        yield presigned_source_url(bucket_name, s3_key)
+    else:
+        with get_source_cache().open(bucket_name, s3_key) as source_path:
+            yield source_path
+
+# codec parameters of the first video stream
+def probe_video_stream(file_path):
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=codec_name,profile,pix_fmt,width,height',
+        '-of', 'json',
+        file_path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None
+    streams = json.loads(result.stdout).get('streams', [])
+    return streams[0] if streams else None
+
+# keyframe times of the first video stream between start_time and end_time,
+# only the packets in that interval are read, not the whole source
+def probe_keyframes(file_path, start_time, end_time):
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-read_intervals', f"{start_time}%{end_time}",
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        file_path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    keyframes = []
+    for line in result.stdout.splitlines():
+        fields = line.split(',')
+        if len(fields) >= 2 and 'K' in fields[1] and fields[0] not in ('', 'N/A'):
+            keyframes.append(float(fields[0]))
+    return sorted(keyframes)
+
+# container and first video stream durations of a finished clip, None for any that cannot be read
+def probe_clip_durations(file_path):
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'format=duration:stream=duration',
+        '-of', 'json',
+        file_path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        return None, None
+    probe = json.loads(result.stdout)
+    streams = probe.get('streams', [])
     
+    def seconds(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
     
-    # Create a unique temp directory for this extraction job
-    job_id = str(uuid.uuid4())
-    temp_dir = f"/tmp/clip_farm_{job_id}"
-    os.makedirs(temp_dir, exist_ok=True)
+    return seconds(probe.get('format', {}).get('duration')), seconds(streams[0].get('duration') if streams else None)
+
+# checks a smart cut before it is used: both durations match the requested length and the
+# whole video stream decodes without errors, returns the reason it failed or None
+def verify_clip(file_path, expected_duration, tolerance=SMART_CUT_DURATION_TOLERANCE):
+    format_duration, video_duration = probe_clip_durations(file_path)
+    for name, duration in (('container', format_duration), ('video', video_duration)):
+        if duration is None:
+            return f"{name} duration unreadable"
+        if abs(duration - expected_duration) > tolerance:
+            return f"{name} duration {duration:.2f}s, expected {expected_duration:.2f}s"
     
-    # Download the source video
-    video_filename = os.path.basename(s3_key)
-    local_video_path = os.path.join(temp_dir, video_filename)
+    cmd = ['ffmpeg'] + FFMPEG_QUIET_ARGS + ['-xerror', '-i', file_path, '-map', '0:v:0', '-f', 'null', '-']
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0 or result.stderr.strip():
+        return f"decode errors: {redact_urls(result.stderr.decode(errors='replace'))[-300:]}"
+    return None
+
+# re-encodes the whole clip, seeking on the input so decoding starts near start_time
+def full_encode(file_path, start_time, end_time, output_path, threads=None):
+    cmd = ['ffmpeg'] + FFMPEG_QUIET_ARGS + [
+        '-y',
+        '-ss', str(start_time),
+        '-i', file_path,
+        '-t', str(end_time - start_time),
+        '-map', '0:v:0',
+        '-map', '0:a:0?',
+    ] + encode_args(threads) + [
+        '-c:a', 'aac',
+        '-movflags', '+faststart',
+        output_path
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg encode failed: {redact_urls(result.stderr.decode(errors='replace'))[-500:]}")
+    return output_path
+
+def smart_cut(file_path, start_time, end_time, output_path, temp_dir, stream=None, threads=None):
+    """
+    Cut [start_time, end_time) re-encoding only the frames before the first keyframe
+    at or after start_time and stream-copying the rest of the video. Both parts are
+    written as Annex B H.264 so the head's SPS/PPS travel in-band, concatenated without
+    re-encoding and muxed with the clip's audio as avc3, whose parameter sets may change
+    in-band, so the tail keeps the source's SPS/PPS. Falls back to full_encode when the
+    source is not H.264 with a profile and pixel format the head can be encoded to match,
+    when there is no keyframe inside the clip, or when the joined clip fails verify_clip.
+    stream is the result of probe_video_stream, pass it when cutting many clips from one source.
+    threads caps the encoder threads of each re-encode.
+    Returns 'smart' or 'full' depending on which path produced the clip.
+    """
+    if stream is None:
+        stream = probe_video_stream(file_path)
+    profile = X264_PROFILES.get(stream.get('profile')) if stream else None
+    if stream is None or stream.get('codec_name') != 'h264' or profile is None \
+            or stream.get('pix_fmt') not in SMART_CUT_PIX_FMTS:
+        full_encode(file_path, start_time, end_time, output_path, threads)
+        return 'full'
     
-    print(f"Downloading video from s3://{bucket_name}/{s3_key}...")
-    s3_client.download_file(bucket_name, s3_key, local_video_path)
-    print(f"Downloaded video to {local_video_path}")
+    keyframes = [t for t in probe_keyframes(file_path, start_time, end_time) if start_time <= t < end_time]
+    if not keyframes:
+        full_encode(file_path, start_time, end_time, output_path, threads)
+        return 'full'
+    
+    cut_point = keyframes[0]
+    base = os.path.join(temp_dir, os.path.splitext(os.path.basename(output_path))[0])
+    parts = []
     
-    # Load the video file
     try:
-        video = VideoFileClip(local_video_path)
-        print(f"Loaded video: {video.duration}s duration, {video.size} resolution")
-    except Exception as e:
-        print(f"Error loading video: {e}")
-        return []
+        # head: the partial GOP from start_time up to the keyframe, re-encoded to match the source stream
+        if cut_point - start_time > 0.001:
+            head_path = f"{base}_head.ts"
+            cmd = ['ffmpeg'] + FFMPEG_QUIET_ARGS + [
+                '-y',
+                '-ss', str(start_time),
+                '-i', file_path,
+                '-t', str(cut_point - start_time),
+                '-map', '0:v:0',
+            ] + encode_args(threads) + [
+                '-profile:v', profile,
+                '-pix_fmt', stream['pix_fmt'],
+                '-f', 'mpegts',
+                head_path
+            ]
+            subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            parts.append(head_path)
+        
+        # tail: whole GOPs from the keyframe on, copied as they are
+        tail_path = f"{base}_tail.ts"
+        cmd = ['ffmpeg'] + FFMPEG_QUIET_ARGS + [
+            '-y',
+            '-ss', str(cut_point),
+            '-i', file_path,
+            '-t', str(end_time - cut_point),
+            '-map', '0:v:0',
+            '-c:v', 'copy',
+            '-bsf:v', 'h264_mp4toannexb',
+            '-avoid_negative_ts', 'make_zero',
+            '-f', 'mpegts',
+            tail_path
+        ]
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        parts.append(tail_path)
+        
+        concat_list = f"{base}_parts.txt"
+        with open(concat_list, 'w') as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+        parts.append(concat_list)
+        
+        # join the video parts without re-encoding and take the audio for the exact clip interval
+        cmd = ['ffmpeg'] + FFMPEG_QUIET_ARGS + [
+            '-y',
+            '-f', 'concat',
+            '-safe', '0',
+            '-i', concat_list,
+            '-ss', str(start_time),
+            '-i', file_path,
+            '-t', str(end_time - start_time),
+            '-map', '0:v:0',
+            '-map', '1:a:0?',
+            '-c:v', 'copy',
+            '-tag:v', 'avc3',
+            '-c:a', 'aac',
+            '-movflags', '+faststart',
+            output_path
+        ]
+        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        
+        problem = verify_clip(output_path, end_time - start_time)
+        if problem is not None:
+            print(f"Smart cut failed verification ({problem}), falling back to a full encode")
+            full_encode(file_path, start_time, end_time, output_path, threads)
+            return 'full'
+    except subprocess.CalledProcessError as e:
+        print(f"Smart cut failed ({redact_urls(e.stderr.decode(errors='replace'))[-300:]}), falling back to a full encode")
+        full_encode(file_path, start_time, end_time, output_path, threads)
+        return 'full'
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
     
-    # Process each clip
-    extracted_clips = []
+    return 'smart'
+
+def extract_clips_from_s3(clips, s3_key, bucket_name="uploaded-clips", output_bucket="clip-farm-results", smart=True,
+                          range_read=SOURCE_RANGE_READ, max_workers=None):
+    """
+    Cut every clip from one S3 source and upload it. The source is probed once, then the clips
+    run as parallel ffmpeg jobs (at most max_workers, the CPU count by default) that share the cores
+    between their encoders, and each clip is uploaded by its job as soon as it is cut. Returns the
+    clip metadata ordered by clip number.
+    """
+    
+    # Each extraction job works in its own workspace, removed when the job ends
+    video_filename = os.path.basename(s3_key)
+    with job_workspace('cut') as workspace, open_source(bucket_name, s3_key, range_read) as source_path:
+        return _extract_clips(clips, s3_key, source_path, video_filename, workspace, output_bucket, smart,
+                              max_workers)
+
+def _extract_clips(clips, s3_key, source_path, video_filename, workspace, output_bucket, smart, max_workers):
+    # codec parameters are shared by every clip of the source
+    stream = probe_video_stream(source_path) if smart else None
     
-    for i, clip in enumerate(clips):
+    def extract_one(clip_number, clip):
         start_time = clip["start_time"]
         end_time = clip["end_time"]
-        duration = clip["duration"]
-        transcript = clip["transcript"]
         
         # Create output filename
-        clip_name = f"{os.path.splitext(video_filename)[0]}_clip_{i+1}_{start_time:.2f}-{end_time:.2f}.mp4"
-        clip_path = os.path.join(temp_dir, clip_name)
+        clip_name = f"{os.path.splitext(video_filename)[0]}_clip_{clip_number}_{start_time:.2f}-{end_time:.2f}.mp4"
+        clip_path = workspace.path(clip_name)
         
-        try:
-            # Extract the subclip using MoviePy
-            print(f"Extracting clip {i+1}: {start_time:.2f}s - {end_time:.2f}s...")
-            subclip = video.subclip(start_time, end_time)
-            
-            # Write the clip to file
-            subclip.write_videofile(
-                clip_path,
-                codec='libx264',
-                audio_codec='aac',
-                temp_audiofile=f"{temp_dir}/temp-audio.m4a",
-                remove_temp=True,
-                fps=video.fps,
-                preset='fast'  # Options: ultrafast, superfast, veryfast, faster, fast, medium, slow, slower, veryslow
-            )
-            
-            print(f"Clip extracted to {clip_path}")
-            
-            # Upload clip to S3
-            s3_clip_key = f"{os.path.basename(clip_path)}"
-            s3_client.upload_file(clip_path, output_bucket, s3_clip_key)
-            print(f"Uploaded clip to s3://{output_bucket}/{s3_clip_key}")
-            
-            # Create metadata for the clip
-            clip_info = {
-                "source_video": s3_key,
-                "clip_number": i + 1,
-                "start_time": start_time,
-                "end_time": end_time,
-                "duration": duration,
-                "transcript": transcript,
-                "s3_uri": f"s3://{output_bucket}/{s3_clip_key}",
-                "filename": clip_name
-            }
-            
-            extracted_clips.append(clip_info)
-            
-            # Close the subclip to free memory
-            subclip.close()
-            
-        except Exception as e:
-            print(f"Error extracting clip {i+1}: {e}")
-    
-    # Close the video to free memory
-    video.close()
-    
-    # Clean up temporary files
-    try:
-        for file in os.listdir(temp_dir):
-            os.remove(os.path.join(temp_dir, file))
-        os.rmdir(temp_dir)
-        print(f"Cleaned up temporary directory {temp_dir}")
-    except Exception as e:
-        print(f"Warning: Could not clean up temp directory {temp_dir}: {e}")
+        # Re-encode only the partial GOP at the start of the clip, or the whole clip when smart cuts are off
+        print(f"Extracting clip {clip_number}: {start_time:.2f}s - {end_time:.2f}s...")
+        if smart:
+            mode = smart_cut(source_path, start_time, end_time, clip_path, workspace.root, stream, threads)
+        else:
+            mode = 'full'
+            full_encode(source_path, start_time, end_time, clip_path, threads)
+        
+        print(f"Clip extracted to {clip_path} ({mode} cut)")
+        workspace.check_quota()
+        
+        # Upload clip to S3
+        s3_clip_key = f"{os.path.basename(clip_path)}"
+        s3_client.upload_file(clip_path, output_bucket, s3_clip_key)
+        print(f"Uploaded clip to s3://{output_bucket}/{s3_clip_key}")
+        os.remove(clip_path)
+        
+        # Create metadata for the clip
+        return {
+            "source_video": s3_key,
+            "clip_number": clip_number,
+            "start_time": start_time,
+            "end_time": end_time,
+            "duration": clip["duration"],
+            "transcript": clip["transcript"],
+            "s3_uri": f"s3://{output_bucket}/{s3_clip_key}",
+            "filename": clip_name
+        }
+    
+    # Process the clips in parallel, each one is uploaded as soon as it is cut
+    extracted_clips = []
+    workers = max(1, min(len(clips), max_workers or os.cpu_count() or 1))
+    # the cores are split between the jobs so they run about one encoder thread per core in total
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(extract_one, i + 1, clip): i + 1 for i, clip in enumerate(clips)}
+        for future in as_completed(futures):
+            try:
+                extracted_clips.append(future.result())
+            except Exception as e:
+                print(f"Error extracting clip {futures[future]}: {e}")
+    
+    extracted_clips.sort(key=lambda clip_info: clip_info["clip_number"])
     
     return extracted_clips
 
@@ -0,0 +1,49 @@
+import os
+import boto3
+from dotenv import load_dotenv
+
+load_dotenv()
+
+AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY")
+AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+s3_client = boto3.client('s3', region_name=AWS_REGION, aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                         endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
+
+# how long a download link stays valid
+DOWNLOAD_URL_EXPIRES = int(os.environ.get("DOWNLOAD_URL_EXPIRES", 3600))
+
+
+# splits s3://bucket/key into (bucket, key)
+def parse_s3_uri(s3_uri):
+    if not s3_uri.startswith('s3://') or '/' not in s3_uri[5:]:
+        raise ValueError(f"Invalid S3 URI: {s3_uri}")
+    bucket_name, s3_key = s3_uri[5:].split('/', 1)
+    return bucket_name, s3_key
+
+
+def presigned_download_url(s3_uri, filename=None, expires=DOWNLOAD_URL_EXPIRES, content_type='video/mp4'):
+    """
+    Presigned GET URL for a finished clip. S3 sends the response with a Content-Disposition
+    of attachment, so browsers save it under filename instead of playing it inline, and the
+    bytes go straight from S3 to the browser without passing through the app's memory.
+    """
+    bucket_name, s3_key = parse_s3_uri(s3_uri)
+    filename = (filename or os.path.basename(s3_key)).replace('"', '')
+    return s3_client.generate_presigned_url(
+        'get_object',
+        Params={
+            'Bucket': bucket_name,
+            'Key': s3_key,
+            'ResponseContentDisposition': f'attachment; filename="{filename}"',
+            'ResponseContentType': content_type
+        },
+        ExpiresIn=expires
+    )
+
+
+# shows a download button for an S3 object in a Streamlit container (st or a placeholder)
+def show_download_link(container, s3_uri, label, filename=None):
+    url = presigned_download_url(s3_uri, filename)
+    container.link_button(label, url)
+    return url
@@ -0,0 +1,157 @@
+import numpy as np
+from transcript import Transcript
+
+# words that tend to mark emotional or high-energy moments
+EMOTIVE_TERMS = {
+    'amazing', 'awesome', 'crazy', 'insane', 'love', 'hate', 'wow', 'omg', 'literally',
+    'honestly', 'seriously', 'unbelievable', 'incredible', 'terrible', 'horrible', 'scared',
+    'shocked', 'never', 'always', 'best', 'worst', 'funny', 'hilarious', 'secret', 'truth',
+    'wild', 'weird', 'obsessed', 'furious', 'angry', 'cried', 'crying', 'laughing', 'dead',
+    'dying', 'shit', 'fuck', 'fucking', 'damn', 'god', 'oh', 'what', 'why', 'no', 'yes',
+}
+
+# weight of each feature in the window score, features are z-scored across windows first
+FEATURE_WEIGHTS = {
+    'speech_rate': 1.0,
+    'pause_ratio': -0.8,
+    'exclamations': 1.2,
+    'questions': 0.8,
+    'confidence': 0.5,
+    'emotive': 1.0,
+}
+
+# gaps between words longer than this count as pauses
+PAUSE_SECONDS = 0.6
+
+
+# prefix sums with a leading zero, so sum(values[i:j]) == prefix[j] - prefix[i]
+def _prefix(values):
+    return np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+
+
+def _zscore(values):
+    spread = values.std()
+    if spread == 0:
+        return np.zeros_like(values)
+    return (values - values.mean()) / spread
+
+
+def score_windows(transcript, min_duration=30, max_duration=60, step_words=5):
+    """
+    Score candidate windows between min_duration and max_duration seconds without an LLM.
+    Windows start every step_words words and end at min, mid and max duration; every feature
+    is computed for all windows at once from prefix sums over the word arrays.
+    Returns (starts, ends, scores) as word index arrays (end inclusive) and float scores.
+    """
+    transcript = Transcript.coerce(transcript)
+    words = transcript.words_only()
+    count = len(words)
+    if count < 2:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+
+    word_starts = np.asarray(words.start)
+    word_ends = np.asarray(words.end)
+
+    # per-token flags computed once over the vocabulary, then gathered by token id
+    vocab_exclamation = np.array([token.endswith('!') for token in transcript.vocab], dtype=bool)
+    vocab_question = np.array([token.endswith('?') for token in transcript.vocab], dtype=bool)
+    vocab_emotive = np.array([token.lower() in EMOTIVE_TERMS for token in transcript.vocab], dtype=bool)
+
+    token_ids = np.asarray(transcript.token_ids)
+    prefix_exclamations = _prefix(vocab_exclamation[token_ids])
+    prefix_questions = _prefix(vocab_question[token_ids])
+    emotive = vocab_emotive[np.asarray(words.token_ids)]
+
+    # item position of each word, and of the item after it, to count punctuation in item space
+    positions = np.flatnonzero(~np.asarray(transcript.is_punctuation))
+    following = np.append(positions[1:], len(transcript))
+
+    gaps = np.zeros(count)
+    gaps[1:] = np.maximum(word_starts[1:] - word_ends[:-1], 0.0)
+    pauses = np.where(gaps > PAUSE_SECONDS, gaps, 0.0)
+
+    prefix_pauses = _prefix(pauses)
+    prefix_confidence = _prefix(np.asarray(words.confidence, dtype=np.float64))
+    prefix_emotive = _prefix(emotive)
+
+    # candidate windows: every step_words-th word as a start, three target lengths each
+    window_starts = np.arange(0, count, step_words)
+    targets = np.array([min_duration, (min_duration + max_duration) / 2, max_duration], dtype=np.float64)
+    start_grid = np.repeat(window_starts, len(targets))
+    target_times = word_starts[start_grid] + np.tile(targets, len(window_starts))
+
+    # last word starting before the target time
+    end_grid = np.searchsorted(word_starts, target_times, side='left') - 1
+    end_grid = np.minimum(end_grid, count - 1)
+
+    durations = word_ends[end_grid] - word_starts[start_grid]
+    valid = (end_grid > start_grid) & (durations >= min_duration * 0.9) & (durations <= max_duration * 1.1)
+    start_grid, end_grid, durations = start_grid[valid], end_grid[valid], durations[valid]
+    if len(start_grid) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+
+    # pauses inside the window exclude the gap before its first word,
+    # punctuation counts include what follows the last word
+    lo, hi = start_grid, end_grid + 1
+    item_lo, item_hi = positions[start_grid], following[end_grid]
+    word_counts = (hi - lo).astype(np.float64)
+    features = {
+        'speech_rate': word_counts / durations,
+        'pause_ratio': (prefix_pauses[hi] - prefix_pauses[lo + 1]) / durations,
+        'exclamations': (prefix_exclamations[item_hi] - prefix_exclamations[item_lo]) / word_counts,
+        'questions': (prefix_questions[item_hi] - prefix_questions[item_lo]) / word_counts,
+        'confidence': (prefix_confidence[hi] - prefix_confidence[lo]) / word_counts,
+        'emotive': (prefix_emotive[hi] - prefix_emotive[lo]) / word_counts,
+    }
+
+    scores = np.zeros(len(start_grid))
+    for name, weight in FEATURE_WEIGHTS.items():
+        scores += weight * _zscore(features[name])
+
+    return start_grid, end_grid, scores
+
+
+def rank_windows(transcript_json, top_k=5, min_duration=30, max_duration=60, step_words=5):
+    """
+    Fast LLM-free clip selection: the top_k highest-scoring non-overlapping windows,
+    returned in the same shape as extract_engaging_clips_ollama's clip suggestions.
+    """
+    transcript = Transcript.coerce(transcript_json)
+    words = transcript.words_only()
+    starts, ends, scores = score_windows(transcript, min_duration, max_duration, step_words)
+    if len(scores) == 0:
+        return []
+
+    word_texts = words.tokens()
+    taken = np.zeros(len(words), dtype=bool)
+    # map the scores to (0, 1) so they read like the LLM path's confidence
+    confidences = 1 / (1 + np.exp(-scores / sum(abs(weight) for weight in FEATURE_WEIGHTS.values())))
+
+    clips = []
+    for i in np.argsort(-scores):
+        start, end = int(starts[i]), int(ends[i])
+        if taken[start:end + 1].any():
+            continue
+        taken[start:end + 1] = True
+
+        start_time = float(words.start[start])
+        end_time = float(words.end[end])
+        clips.append({
+            'start_time': round(start_time, 2),
+            'end_time': round(end_time, 2),
+            'duration': round(end_time - start_time, 2),
+            'transcript': ' '.join(word_texts[start:end + 1]),
+            'confidence': round(float(confidences[i]), 2)
+        })
+        if len(clips) == top_k:
+            break
+
+    return clips
+
+
+# text of the top_k shortlisted windows in timeline order, for prompting the LLM with only those
+def shortlist_text(transcript_json, top_k=10, min_duration=30, max_duration=60):
+    clips = sorted(rank_windows(transcript_json, top_k, min_duration, max_duration), key=lambda c: c['start_time'])
+    return '\n...\n'.join(clip['transcript'] for clip in clips)
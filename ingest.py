@@ -0,0 +1,185 @@
+import struct
+import hashlib
+import threading
+
+# size of each read from an uploaded file, this bounds how much of the upload is held in memory at once
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# S3 requires every multipart part except the last to be at least 5 MB
+MULTIPART_PART_SIZE = 16 * 1024 * 1024
+
+
+# yields an uploaded file (Streamlit UploadedFile or any binary file object) in fixed-size chunks
+def iter_chunks(file_obj, chunk_size=CHUNK_SIZE):
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+# sha256 of an uploaded file, read in the same bounded chunks as the ingest path
+def hash_stream(file_obj, chunk_size=CHUNK_SIZE):
+    hasher = hashlib.sha256()
+    for chunk in iter_chunks(file_obj, chunk_size):
+        hasher.update(chunk)
+
+    if hasattr(file_obj, 'seek'):
+        file_obj.seek(0)
+    return hasher.hexdigest()
+
+
+# stable video id derived from the file content, identical uploads map to the same S3 keys
+def content_video_id(file_obj):
+    if isinstance(file_obj, str):
+        with open(file_obj, 'rb') as f:
+            return f"video_{hash_stream(f)[:32]}"
+    return f"video_{hash_stream(file_obj)[:32]}"
+
+
+# checks whether an MP4 keeps its moov atom ahead of mdat, in which case ffmpeg
+# can demux it from a non-seekable pipe while the rest of the file is still arriving
+def is_faststart(head):
+    offset = 0
+    while offset + 8 <= len(head):
+        size, atom_type = struct.unpack('>I4s', head[offset:offset + 8])
+        if atom_type == b'moov':
+            return True
+        if atom_type == b'mdat':
+            return False
+
+        if size == 1:
+            # 64-bit size stored after the type
+            if offset + 16 > len(head):
+                return False
+            size = struct.unpack('>Q', head[offset + 8:offset + 16])[0]
+        elif size == 0:
+            # atom runs to the end of the file
+            return False
+
+        if size < 8:
+            return False
+        offset += size
+
+    return False
+
+
+class S3MultipartWriter:
+    """
+    File-like sink that streams written bytes into an S3 multipart upload,
+    holding at most one part in memory
+    """
+
+    def __init__(self, s3_client, bucket, key, part_size=MULTIPART_PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.bytes_written = 0
+
+        response = s3_client.create_multipart_upload(Bucket=bucket, Key=key)
+        self.upload_id = response['UploadId']
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.bytes_written += len(data)
+
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[:self.part_size]))
+            del self.buffer[:self.part_size]
+
+    def _upload_part(self, body):
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=body
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+
+    def close(self):
+        # the final part may be smaller than the minimum part size
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer = bytearray()
+
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={'Parts': self.parts}
+        )
+
+    def abort(self):
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+class IngestStream:
+    """
+    Copies an uploaded file chunk by chunk into one or more sinks (a local file,
+    an ffmpeg stdin pipe, an S3MultipartWriter) on a background thread
+    """
+
+    def __init__(self, file_obj, chunk_size=CHUNK_SIZE):
+        self.chunks = iter_chunks(file_obj, chunk_size)
+        self.head = next(self.chunks, b'')
+        self.bytes_read = 0
+        self.error = None
+        self.dropped = []
+        self.thread = None
+
+    # sinks in droppable (e.g. an ffmpeg stdin pipe) that stop reading are dropped,
+    # the copy into the remaining sinks carries on so a source upload still completes
+    def start(self, sinks, close_sinks=(), droppable=()):
+        self.thread = threading.Thread(target=self._run, args=(list(sinks), list(close_sinks), list(droppable)))
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def _run(self, sinks, close_sinks, droppable):
+        try:
+            chunk = self.head
+            while chunk:
+                for sink in list(sinks):
+                    try:
+                        sink.write(chunk)
+                    except BrokenPipeError:
+                        # the reader exited, its own exit code reports why
+                        if not any(sink is d for d in droppable):
+                            raise
+                        sinks.remove(sink)
+                        self.dropped.append(sink)
+                self.bytes_read += len(chunk)
+                chunk = next(self.chunks, b'')
+        except Exception as e:
+            self.error = e
+        finally:
+            for sink in close_sinks:
+                if any(sink is d for d in self.dropped):
+                    try:
+                        sink.close()
+                    except Exception:
+                        pass
+                    continue
+                try:
+                    # never complete a partial multipart upload
+                    if self.error is not None and hasattr(sink, 'abort'):
+                        sink.abort()
+                    else:
+                        sink.close()
+                except Exception as e:
+                    if self.error is None:
+                        self.error = e
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+        return self.bytes_read
+
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# how many generate requests the local model serves at once, callers beyond this wait their turn
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get("OLLAMA_MAX_CONCURRENCY", "2"))
+
+# how long Ollama keeps the model loaded after a request, so the next caller does not pay the load time
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+
+class OllamaClient:
+    """
+    Shared client for the local Ollama server. Requests go through one pooled HTTP session,
+    wait for one of max_concurrency slots so concurrent callers do not thrash the model,
+    ask Ollama to keep the model warm, and are retried with exponential backoff on 5xx
+    responses and connection errors. Per-request latency and token rate are recorded.
+    """
+
+    def __init__(self, base_url=OLLAMA_BASE_URL, max_concurrency=OLLAMA_MAX_CONCURRENCY,
+                 keep_alive=OLLAMA_KEEP_ALIVE, max_retries=3, backoff=1.0, metrics_size=500):
+        self.base_url = base_url.rstrip('/')
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency * 2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.metrics = deque(maxlen=metrics_size)
+        self.metrics_lock = threading.Lock()
+
+    # POSTs to /api/generate, retrying 5xx responses and connection failures
+    def _post(self, payload, stream, timeout):
+        url = f"{self.base_url}/api/generate"
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(url, json=payload, stream=stream, timeout=timeout)
+                if response.status_code < 500 or attempt == self.max_retries:
+                    response.raise_for_status()
+                    return response
+                logger.warning(f"Ollama returned {response.status_code}, retrying...")
+                response.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Ollama request failed ({e}), retrying...")
+            time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.0))
+
+    def _payload(self, prompt, model, stream, options):
+        payload = {
+            'model': model,
+            'prompt': prompt,
+            'stream': stream,
+            'keep_alive': self.keep_alive
+        }
+        if options:
+            payload['options'] = options
+        return payload
+
+    def _record(self, model, queued_at, started_at, result):
+        finished_at = time.time()
+        eval_count = result.get('eval_count', 0)
+        eval_seconds = result.get('eval_duration', 0) / 1e9
+        with self.metrics_lock:
+            self.metrics.append({
+                'model': model,
+                'queue_seconds': started_at - queued_at,
+                'latency_seconds': finished_at - started_at,
+                'prompt_tokens': result.get('prompt_eval_count', 0),
+                'generated_tokens': eval_count,
+                'tokens_per_second': eval_count / eval_seconds if eval_seconds else 0.0,
+                'load_seconds': result.get('load_duration', 0) / 1e9
+            })
+
+    def generate(self, prompt, model, timeout=60, options=None):
+        queued_at = time.time()
+        with self.slots:
+            started_at = time.time()
+            response = self._post(self._payload(prompt, model, False, options), False, timeout)
+            result = response.json()
+        self._record(model, queued_at, started_at, result)
+        return result.get('response', '')
+
+    # yields response text as it is generated, the slot is held until the stream is finished
+    def stream_generate(self, prompt, model, timeout=60, options=None):
+        queued_at = time.time()
+        with self.slots:
+            started_at = time.time()
+            with self._post(self._payload(prompt, model, True, options), True, timeout) as response:
+                # the body is NDJSON, one object per generated chunk, the last one carries the stats
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get('response'):
+                        yield chunk['response']
+                    if chunk.get('done'):
+                        self._record(model, queued_at, started_at, chunk)
+                        break
+
+    # loads the model without generating anything, so the first real request is not slowed by the load
+    def warm(self, model):
+        with self.slots:
+            self._post({'model': model, 'keep_alive': self.keep_alive}, False, 300)
+
+    # summary of the recorded requests
+    def stats(self):
+        with self.metrics_lock:
+            metrics = list(self.metrics)
+        if not metrics:
+            return {'requests': 0}
+
+        latencies = sorted(m['latency_seconds'] for m in metrics)
+        rates = [m['tokens_per_second'] for m in metrics if m['tokens_per_second']]
+        return {
+            'requests': len(metrics),
+            'mean_latency_seconds': sum(latencies) / len(latencies),
+            'p95_latency_seconds': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+            'mean_queue_seconds': sum(m['queue_seconds'] for m in metrics) / len(metrics),
+            'mean_tokens_per_second': sum(rates) / len(rates) if rates else 0.0
+        }
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+# the process-wide client shared by every caller
+def get_default_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = OllamaClient()
+        return _default_client
@@ -1,32 +1,112 @@
 import os
 import sys
+import csv
+import time
+import subprocess
 import tempfile
 from moviepy.editor import VideoFileClip
 import streamlit as st
-import threading
-from queue import Queue
-from queue_upload import upload_worker, upload_clip_to_s3
+from queue_upload import create_upload_queue, start_upload_pool, stop_upload_pool
+from ingest import IngestStream, is_faststart, content_video_id
+from workspace import job_workspace
 import uuid
 
+# audio proxy formats for transcription: ffmpeg codec arguments and file extension
+AUDIO_PROXY_FORMATS = {
+    'flac': (['-c:a', 'flac'], '.flac'),
+    'opus': (['-c:a', 'libopus', '-b:a', '24k', '-application', 'voip'], '.ogg'),
+}
 
-def cut_video(input_file, segment_length=300, upload_queue=None, video_id=None):
+
+class SegmentingError(RuntimeError):
+    """ffmpeg could not segment the source, segments holds whatever was cut before it failed"""
+
+    def __init__(self, message, segments):
+        super().__init__(message)
+        self.segments = segments
+
+
+def cut_video(input_file, segment_length=300, upload_queue=None, video_id=None, single_pass=True, source_sink=None,
+              audio_proxy='flac', workspace=None):
     if video_id is None:
         video_id = f"video_{uuid.uuid4()}"
     
-    # Handle Streamlit UploadedFile
-    if hasattr(input_file, 'name') and not isinstance(input_file, str):
-        temp_dir = tempfile.mkdtemp()
-        temp_path = os.path.join(temp_dir, input_file.name)
+    # segments are uploaded after cut_video returns, so the caller's workspace has to outlive it
+    temp_dir = workspace.root if workspace is not None else tempfile.mkdtemp()
+    temp_path = None
+    
+    # source_sink (e.g. an S3MultipartWriter) receives a copy of the original while it is being segmented
+    extra_sinks = [source_sink] if source_sink is not None else []
+    
+    # Handle Streamlit UploadedFile, read in bounded chunks instead of one full in-memory copy
+    if hasattr(input_file, 'read') and not isinstance(input_file, str):
+        ingest = IngestStream(input_file)
         
+        if single_pass and is_faststart(ingest.head):
+            # moov is at the head, so ffmpeg can segment straight from the stream while it is still arriving
+            st.write("Streaming upload directly into the segmenter")
+            try:
+                return _cut_video_single_pass('pipe:0', temp_dir, segment_length, upload_queue, video_id,
+                                              audio_proxy, ingest=ingest, extra_sinks=extra_sinks)
+            except SegmentingError as e:
+                # the header sniff was wrong and ffmpeg could not demux the stream; retry from a spooled
+                # copy, but only if nothing was queued for upload yet and the upload can be read again
+                if e.segments or not hasattr(input_file, 'seek'):
+                    raise
+                st.write(f"{e}, retrying from a copy on disk")
+                input_file.seek(0)
+                ingest = IngestStream(input_file)
+                # the source copy was completed by the first pass
+                extra_sinks = []
+        
+        # otherwise the demuxer needs to seek, so spool the upload to disk first
+        temp_path = os.path.join(temp_dir, os.path.basename(getattr(input_file, 'name', 'upload.mp4')))
         with open(temp_path, "wb") as f:
-            f.write(input_file.getbuffer())
+            ingest.start([f] + extra_sinks, close_sinks=extra_sinks).join()
+        if ingest.error is not None:
+            raise ingest.error
         
         file_path = temp_path
+        source_ingest = None
     else:
         file_path = input_file
+        source_ingest = None
+        if extra_sinks:
+            source_file = open(file_path, 'rb')
+            source_ingest = IngestStream(source_file).start(extra_sinks, close_sinks=extra_sinks)
     
-    # Get video duration using ffprobe
-    import subprocess
+    duration = probe_duration(file_path)
+    st.write(f"Video duration: {duration} seconds")
+    
+    try:
+        if single_pass:
+            output_files = _cut_video_single_pass(file_path, temp_dir, segment_length, upload_queue, video_id,
+                                                  audio_proxy)
+        else:
+            output_files = _cut_video_per_segment(file_path, temp_dir, duration, segment_length, upload_queue,
+                                                  video_id, audio_proxy)
+    finally:
+        if source_ingest is not None:
+            source_ingest.join()
+            source_file.close()
+    
+    if source_ingest is not None:
+        # the source sinks (e.g. the multipart upload) were aborted
+        if source_ingest.error is not None:
+            raise RuntimeError(f"Copying the source video failed, source copy aborted: {source_ingest.error}") \
+                from source_ingest.error
+    
+    # Clean up
+    if temp_path is not None:
+        try:
+            os.remove(temp_path)
+        except:
+            pass
+                
+    return output_files
+
+# gets the container duration in seconds using ffprobe
+def probe_duration(file_path):
     cmd = [
         'ffprobe', 
         '-v', 'error', 
@@ -35,10 +115,131 @@ def cut_video(input_file, segment_length=300, upload_queue=None, video_id=None):
         file_path
     ]
     result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    duration = float(result.stdout.strip())
+    return float(result.stdout.strip())
+
+# writes a compact mono speech-rate audio track next to a segment for transcription
+# the proxy is taken from the finished segment (a small local file) so its timeline matches the segment exactly
+def make_audio_proxy(segment_file, proxy_format='flac'):
+    codec_args, extension = AUDIO_PROXY_FORMATS[proxy_format]
+    proxy_file = os.path.splitext(segment_file)[0] + extension
     
-    st.write(f"Video duration: {duration} seconds")
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-i', segment_file,
+        '-vn',  # Drop the video stream
+        '-ac', '1',
+        '-ar', '16000',
+    ] + codec_args + [proxy_file]
+    
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        st.write(f"Could not create audio proxy for {segment_file}")
+        return None
+    return proxy_file
+
+# reads the completed rows of an ffmpeg csv segment list as (filename, start, end)
+# rows without a trailing newline are still being written and are skipped
+def _read_segment_list(segment_list_path):
+    if not os.path.exists(segment_list_path):
+        return []
     
+    entries = []
+    with open(segment_list_path, 'r', newline='') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            row = next(csv.reader([line]))
+            if len(row) < 3:
+                continue
+            entries.append((row[0], float(row[1]), float(row[2])))
+    return entries
+
+# reads the source once and lets the segment muxer write every keyframe-aligned segment
+# in a single stream-copy pass, handing each segment to the upload queue as soon as it is closed
+# when an ingest stream is given, ffmpeg reads the upload from stdin as it is copied in
+def _cut_video_single_pass(file_path, temp_dir, segment_length, upload_queue, video_id, audio_proxy,
+                           ingest=None, extra_sinks=()):
+    segment_pattern = os.path.join(temp_dir, f"segment_%03d_{video_id}.mp4")
+    segment_list_path = os.path.join(temp_dir, f"segments_{video_id}.csv")
+    log_path = os.path.join(temp_dir, f"segments_{video_id}.log")
+    
+    st.write(f"Cutting into ~{segment_length}s segments in a single pass")
+    
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-i', file_path,
+        '-c', 'copy',  # Copy all streams without re-encoding
+        '-f', 'segment',
+        '-segment_time', str(segment_length),
+        '-segment_list', segment_list_path,
+        '-segment_list_type', 'csv',
+        '-reset_timestamps', '1',
+        '-avoid_negative_ts', '1',
+        segment_pattern
+    ]
+    
+    output_files = []
+    with open(log_path, 'w') as log_file:
+        process = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if ingest is not None else None,
+            stdout=subprocess.DEVNULL,
+            stderr=log_file
+        )
+        
+        if ingest is not None:
+            sinks = [process.stdin] + list(extra_sinks)
+            ingest.start(sinks, close_sinks=sinks, droppable=[process.stdin])
+        
+        while True:
+            finished = process.poll() is not None
+            
+            # the segment list gains a row each time a segment is closed, with the real cut points
+            entries = _read_segment_list(segment_list_path)
+            for filename, start_time, end_time in entries[len(output_files):]:
+                i = len(output_files)
+                st.write(f"Finished segment {i+1}: {start_time:.2f}s to {end_time:.2f}s")
+                
+                segment_info = {
+                    'file': os.path.join(temp_dir, filename),
+                    'start_time': start_time,
+                    'duration': end_time - start_time,
+                    'segment_index': i,
+                    'video_id': video_id
+                }
+                
+                if audio_proxy is not None:
+                    segment_info['audio_file'] = make_audio_proxy(segment_info['file'], audio_proxy)
+                
+                output_files.append(segment_info)
+                
+                if upload_queue is not None:
+                    upload_queue.put(segment_info)
+            
+            if finished:
+                break
+            time.sleep(0.5)
+    
+    if ingest is not None:
+        ingest.join()
+        st.write(f"Ingested {ingest.bytes_read / (1024 * 1024):.1f} MB from upload")
+        # the other sinks (e.g. the source multipart upload) were aborted
+        if ingest.error is not None:
+            raise RuntimeError(f"Upload ingest failed, source copy aborted: {ingest.error}") from ingest.error
+    
+    if process.returncode != 0:
+        with open(log_path, 'r', errors='replace') as log_file:
+            log_tail = log_file.read()[-500:]
+        raise SegmentingError(f"FFmpeg segmenting exited with code {process.returncode}: {log_tail}", output_files)
+    
+    st.write(f"Created {len(output_files)} segments")
+    return output_files
+
+# legacy mode: one ffmpeg run per segment, seeking on the input so each run starts near its cut point
+def _cut_video_per_segment(file_path, temp_dir, duration, segment_length, upload_queue, video_id,
+                           audio_proxy):
     num_segments = int(duration / segment_length) + (1 if duration % segment_length > 0 else 0)
     st.write(f"Will create {num_segments} segments")
     
@@ -63,9 +264,9 @@ def cut_video(input_file, segment_length=300, upload_queue=None, video_id=None):
         # Use FFmpeg to cut without re-encoding
         cmd = [
             'ffmpeg',
-            '-i', file_path,
             '-ss', str(start_time),
-            '-to', str(end_time),
+            '-i', file_path,
+            '-t', str(end_time - start_time),
             '-c:v', 'copy',  # Copy video stream without re-encoding
             '-c:a', 'copy',  # Copy audio stream without re-encoding
             '-avoid_negative_ts', '1',
@@ -82,18 +283,14 @@ def cut_video(input_file, segment_length=300, upload_queue=None, video_id=None):
             'video_id': video_id
         }
         
+        if audio_proxy is not None:
+            segment_info['audio_file'] = make_audio_proxy(output_file, audio_proxy)
+        
         output_files.append(segment_info)
         
         if upload_queue is not None:
             upload_queue.put(segment_info)
     
-    # Clean up
-    if 'temp_path' in locals():
-        try:
-            os.remove(temp_path)
-        except:
-            pass
-                
     return output_files
 
 if __name__ == "__main__":
@@ -115,33 +312,34 @@ if __name__ == "__main__":
         sys.exit(1)
     
     try:
-        # create an upload queue
-        upload_queue = Queue()
+        # create a bounded upload queue
+        upload_queue = create_upload_queue()
         
-        # start the upload worker thread
-        upload_thread = threading.Thread(target=upload_worker, args=(upload_queue,))
-        upload_thread.start()
+        # start the pool of upload workers
+        upload_threads = start_upload_pool(upload_queue)
         
-        # generate a video ID
-        video_id = f"video_{uuid.uuid4()}"
+        # derive the video ID from the file content
+        video_id = content_video_id(input_video_path)
         
         # create 5-minute segments and add them to the upload queue
-        segments = cut_video(
-            input_video_path, 
-            segment_length=300, 
-            upload_queue=upload_queue,
-            video_id=video_id
-        )
-        
-        print(f"\nCreated {len(segments)} segments:")
-        for i, segment in enumerate(segments):
-            print(f"Segment {i}: {segment['file']} (Start: {segment['start_time']}s, Duration: {segment['duration']}s)")
-        
-        print("\nWaiting for uploads to complete...")
-        upload_queue.join()
-        
-        upload_queue.put(None)
-        upload_thread.join()
+        # segments can add up to the whole source, so the workspace has no quota
+        with job_workspace('ingest', quota_bytes=None) as workspace:
+            try:
+                segments = cut_video(
+                    input_video_path, 
+                    segment_length=300, 
+                    upload_queue=upload_queue,
+                    video_id=video_id,
+                    workspace=workspace
+                )
+            finally:
+                # drain and stop the workers before the workspace and its segments are removed
+                print("\nWaiting for uploads to complete...")
+                stop_upload_pool(upload_queue, upload_threads)
+            
+            print(f"\nCreated {len(segments)} segments:")
+            for i, segment in enumerate(segments):
+                print(f"Segment {i}: {segment['file']} (Start: {segment['start_time']}s, Duration: {segment['duration']}s)")
         
         print("\nAll segments have been uploaded to S3!")
         print("\nTest completed successfully!")
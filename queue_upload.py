@@ -1,8 +1,14 @@
 import os
+import json
+import time
+import threading
 import boto3
 import uuid
 from dotenv import load_dotenv
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from ingest import hash_stream
 from moviepy.editor import VideoFileClip
 from queue import Queue
 import streamlit as st
@@ -18,24 +24,122 @@ AWS_SECRET_ACCESS_KEY = os.getenv('AWS_SECRET_ACCESS_KEY')
 AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
 S3_BUCKET_NAME = 'uploaded-clips'
 
+# transcription consumes only the audio-only proxies under AUDIO_PROXY_PREFIX, the full-quality
+# segments are kept apart under SEGMENT_PREFIX for cutting clips, nothing is uploaded to the root
+AUDIO_PROXY_PREFIX = 'audio/'
+SEGMENT_PREFIX = 'segments/'
+
+# one manifest per content-addressed video, written once every segment has been uploaded
+MANIFEST_PREFIX = 'manifests/'
+
+# number of upload workers and how many segments may wait for them before cut_video blocks
+UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', '4'))
+UPLOAD_QUEUE_SIZE = int(os.getenv('UPLOAD_QUEUE_SIZE', '8'))
+
+# multipart settings shared by every worker, each file is split into parts sent in parallel
+transfer_config = TransferConfig(
+    multipart_threshold=16 * 1024 * 1024,
+    multipart_chunksize=16 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+
+# one client shared by all workers, its connection pool is sized for every worker's part uploads at once
 s3_client = boto3.client(
     's3',
     aws_access_key_id=AWS_ACCESS_KEY,
     aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-    region_name=AWS_REGION
+    region_name=AWS_REGION,
+    endpoint_url=os.getenv('S3_ENDPOINT_URL'),
+    config=Config(max_pool_connections=UPLOAD_WORKERS * transfer_config.max_request_concurrency)
 )
 
-# uploads a file to S3 bucket
-def upload_clip_to_s3(file_path, object_name=None):
+# deterministic object name for a segment, video_id is derived from the source content
+def segment_object_name(video_id, segment_index, extension='.mp4'):
+    return f"{video_id}_segment_{segment_index:03d}{extension}"
+
+# full-quality segment URI for the audio proxy URI a transcript was made from, clips are cut from
+# the segment; any other URI is returned as it is
+def segment_uri_for_audio(media_uri):
+    prefix = f"s3://{S3_BUCKET_NAME}/{AUDIO_PROXY_PREFIX}"
+    if not media_uri.startswith(prefix):
+        return media_uri
+    name = os.path.splitext(media_uri[len(prefix):])[0]
+    return f"s3://{S3_BUCKET_NAME}/{SEGMENT_PREFIX}{name}.mp4"
+
+# HEAD check for an object, optionally requiring a matching size
+# S3 answers 403 instead of 404 for a missing key when the caller lacks s3:ListBucket,
+# so both mean "not there" and the object is simply uploaded
+def object_exists(object_name, expected_size=None):
+    try:
+        response = s3_client.head_object(Bucket=S3_BUCKET_NAME, Key=object_name)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound', '403', 'Forbidden', 'AccessDenied'):
+            return False
+        raise
+    return expected_size is None or response['ContentLength'] == expected_size
+
+# loads the upload manifest of a video that was already fully processed, or None
+def load_upload_manifest(video_id):
+    try:
+        response = s3_client.get_object(Bucket=S3_BUCKET_NAME, Key=f"{MANIFEST_PREFIX}{video_id}.json")
+    except ClientError:
+        return None
+    return json.loads(response['Body'].read().decode('utf-8'))
+
+# whether a segment is fully in S3: its upload did not fail, and when an audio proxy was requested
+# (audio_file is set, None if it could not be made) the proxy was uploaded too
+def segment_uploaded(segment):
+    if segment.get('error') or not segment.get('s3_key'):
+        return False
+    return 'audio_file' not in segment or bool(segment.get('audio_uri'))
+
+# records the uploaded segments of a video so repeat submissions can be skipped entirely
+def save_upload_manifest(video_id, segments):
+    manifest = {
+        'video_id': video_id,
+        'segments': [
+            {
+                'segment_index': segment['segment_index'],
+                'start_time': segment['start_time'],
+                'duration': segment['duration'],
+                's3_key': segment.get('s3_key'),
+                'audio_uri': segment.get('audio_uri')
+            }
+            for segment in segments
+        ]
+    }
+    s3_client.put_object(
+        Bucket=S3_BUCKET_NAME,
+        Key=f"{MANIFEST_PREFIX}{video_id}.json",
+        Body=json.dumps(manifest, indent=2),
+        ContentType='application/json'
+    )
+    return manifest
+
+# uploads a file to S3 bucket, skipping it when an object of the same size is already there
+def upload_clip_to_s3(file_path, object_name=None, skip_existing=True):
     if object_name is None:
         object_name = os.path.basename(file_path)
     
+    if skip_existing and object_exists(object_name, os.path.getsize(file_path)):
+        st.write(f"{object_name} already exists in S3, skipping upload")
+        return True
+    
     st.write(f"Uploading {file_path} to S3 bucket {S3_BUCKET_NAME}...")
     try:
-        s3_client.upload_file(file_path, S3_BUCKET_NAME, object_name)
-        st.write(f"Successfully uploaded {object_name} to S3")
+        # the content hash travels with the object so transcripts can be cached by it
+        with open(file_path, 'rb') as f:
+            extra_args = {'Metadata': {'sha256': hash_stream(f)}}
+        
+        file_size = os.path.getsize(file_path)
+        started = time.time()
+        s3_client.upload_file(file_path, S3_BUCKET_NAME, object_name, ExtraArgs=extra_args, Config=transfer_config)
+        elapsed = max(time.time() - started, 1e-6)
+        st.write(f"Successfully uploaded {object_name} to S3 "
+                 f"({file_size / (1024 * 1024):.1f} MB in {elapsed:.1f}s, {file_size / elapsed / (1024 * 1024):.2f} MB/s)")
         return True
-    except ClientError as e:
+    except (ClientError, OSError) as e:
         st.write(f"Error uploading {file_path} to S3: {e}")
         return False
 
@@ -48,13 +152,55 @@ def upload_worker(queue):
             queue.task_done()
             break
             
-        file_path = file_info['file']
-        st.write(f"Processing file: {file_path}")
-        segment_index = file_info.get('segment_index', 0)
-        video_id = file_info.get('video_id', 'unknown')
-        
-        object_name = f"{video_id}_segment_{segment_index:03d}.mp4"
-        
-        # uploads the file
-        upload_clip_to_s3(file_path, object_name)
-        queue.task_done()
\ No newline at end of file
+        # task_done always runs, a worker that died here would leave queue.join() and the cutter's put() blocked
+        try:
+            file_path = file_info['file']
+            st.write(f"Processing file: {file_path}")
+            segment_index = file_info.get('segment_index', 0)
+            video_id = file_info.get('video_id', 'unknown')
+            
+            object_name = SEGMENT_PREFIX + segment_object_name(video_id, segment_index)
+            
+            # uploads the file
+            if upload_clip_to_s3(file_path, object_name):
+                file_info['s3_key'] = object_name
+            else:
+                file_info['error'] = f"upload of {object_name} failed"
+            
+            # uploads the audio proxy that transcription runs on
+            audio_file = file_info.get('audio_file')
+            if audio_file:
+                audio_extension = os.path.splitext(audio_file)[1]
+                audio_object_name = AUDIO_PROXY_PREFIX + segment_object_name(video_id, segment_index, audio_extension)
+                if upload_clip_to_s3(audio_file, audio_object_name):
+                    file_info['audio_uri'] = f"s3://{S3_BUCKET_NAME}/{audio_object_name}"
+                else:
+                    file_info['error'] = f"upload of {audio_object_name} failed"
+        except Exception as e:
+            st.write(f"Error processing {file_info.get('file')}: {e}")
+            file_info['error'] = str(e)
+        finally:
+            queue.task_done()
+
+# creates the bounded queue between cut_video and the upload workers
+# cut_video blocks on put() once maxsize segments are waiting, which keeps the cutter from running far ahead
+def create_upload_queue(maxsize=UPLOAD_QUEUE_SIZE):
+    return Queue(maxsize=maxsize)
+
+# starts num_workers upload_worker threads that all consume the same queue
+def start_upload_pool(queue, num_workers=UPLOAD_WORKERS):
+    threads = []
+    for i in range(num_workers):
+        thread = threading.Thread(target=upload_worker, args=(queue,), name=f"upload-worker-{i}")
+        thread.start()
+        threads.append(thread)
+    return threads
+
+# waits for queued uploads to finish, then stops every worker in the pool
+def stop_upload_pool(queue, threads):
+    queue.join()
+    
+    for _ in threads:
+        queue.put(None)
+    for thread in threads:
+        thread.join()
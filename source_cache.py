@@ -0,0 +1,159 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+import boto3
+from dotenv import load_dotenv
+from cache import make_cache_key
+
+load_dotenv()
+
+AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY")
+AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
+s3_client = boto3.client('s3', region_name='us-east-1', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                         endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
+
+SOURCE_CACHE_DIR = os.environ.get("SOURCE_CACHE_DIR", "source_cache")
+SOURCE_CACHE_MAX_BYTES = int(os.environ.get("SOURCE_CACHE_MAX_BYTES", 10 * 1024 * 1024 * 1024))
+
+
+class SourceCache:
+    """
+    Local copies of S3 source videos shared by every job in the process, bounded by max_bytes.
+    Entries are keyed by bucket, key and ETag, so an overwritten object is fetched again.
+    Each object is downloaded once even when many jobs ask for it at the same time: the first
+    caller downloads while the others wait on that key's lock. Readers hold a reference while
+    they use the file and only unreferenced entries are evicted, least recently used first.
+    Downloads in progress count against the budget, so misses on different keys that would not
+    fit together are downloaded one after the other.
+    """
+
+    def __init__(self, directory, max_bytes, s3_client):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.s3_client = s3_client
+        self.lock = threading.Lock()
+        # notified whenever a download finishes or a reader lets go, either can free budget
+        self.space = threading.Condition(self.lock)
+        self.download_locks = {}
+        # bytes of downloads in progress, they count against the budget before they are entries
+        self.pending_bytes = 0
+        # cache key -> {'path', 'size', 'refs', 'last_used'}
+        self.entries = {}
+        os.makedirs(directory, exist_ok=True)
+
+        # files from earlier runs are still valid, their names are the content-specific keys
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp'):
+                os.remove(path)
+                continue
+            stat = os.stat(path)
+            cache_key = os.path.splitext(name)[0]
+            self.entries[cache_key] = {'path': path, 'size': stat.st_size, 'refs': 0, 'last_used': stat.st_mtime}
+
+    @contextmanager
+    def open(self, bucket_name, s3_key):
+        """
+        Context manager yielding a local path to the object, downloading it on a miss.
+        The file is guaranteed to stay in place until the block exits.
+        """
+        head = self.s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        cache_key = make_cache_key(bucket_name, s3_key, head['ETag'].strip('"'))
+        path = self._acquire(cache_key, bucket_name, s3_key, head['ContentLength'])
+        try:
+            yield path
+        finally:
+            self._release(cache_key)
+
+    def _acquire(self, cache_key, bucket_name, s3_key, size):
+        with self.lock:
+            if self._reference(cache_key):
+                return self.entries[cache_key]['path']
+            download_lock = self.download_locks.setdefault(cache_key, threading.Lock())
+
+        # one download per key, concurrent callers for the same key wait here and then hit
+        with download_lock:
+            with self.lock:
+                if self._reference(cache_key):
+                    return self.entries[cache_key]['path']
+                self._evict(size)
+                # rather than exceed the budget together, wait for the other downloads to finish and become evictable
+                while self.pending_bytes and self._total_bytes() + size > self.max_bytes:
+                    self.space.wait()
+                    self._evict(size)
+                self.pending_bytes += size
+
+            path = os.path.join(self.directory, cache_key + os.path.splitext(s3_key)[1])
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            print(f"Downloading source s3://{bucket_name}/{s3_key} into the source cache...")
+            try:
+                self.s3_client.download_file(bucket_name, s3_key, temp_path)
+                os.replace(temp_path, path)
+                with self.lock:
+                    self.entries[cache_key] = {'path': path, 'size': size, 'refs': 1, 'last_used': time.time()}
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                # a failed download must not leave its lock or its reservation behind
+                with self.lock:
+                    self.pending_bytes -= size
+                    self.download_locks.pop(cache_key, None)
+                    self.space.notify_all()
+            return path
+
+    # takes a reference on a cached entry, the caller holds self.lock
+    def _reference(self, cache_key):
+        entry = self.entries.get(cache_key)
+        if entry is None:
+            return False
+        if not os.path.exists(entry['path']):
+            del self.entries[cache_key]
+            return False
+        entry['refs'] += 1
+        entry['last_used'] = time.time()
+        return True
+
+    def _release(self, cache_key):
+        with self.lock:
+            entry = self.entries.get(cache_key)
+            if entry is None:
+                return
+            entry['refs'] -= 1
+            entry['last_used'] = time.time()
+            self._evict(0)
+            self.space.notify_all()
+
+    # bytes held by cached entries plus downloads in progress, the caller holds self.lock
+    def _total_bytes(self):
+        return sum(entry['size'] for entry in self.entries.values()) + self.pending_bytes
+
+    # removes unreferenced entries, least recently used first, until incoming_bytes more fit the budget
+    # next to the downloads already in progress; entries in use are never removed so the cache can
+    # overshoot while they are read
+    def _evict(self, incoming_bytes):
+        total_bytes = self._total_bytes()
+        idle = sorted((entry['last_used'], cache_key) for cache_key, entry in self.entries.items()
+                      if entry['refs'] == 0)
+        for _, cache_key in idle:
+            if total_bytes + incoming_bytes <= self.max_bytes:
+                break
+            entry = self.entries.pop(cache_key)
+            try:
+                os.remove(entry['path'])
+            except OSError:
+                pass
+            total_bytes -= entry['size']
+
+
+_source_cache = None
+_source_cache_lock = threading.Lock()
+
+
+# the process-wide cache shared by every caller
+def get_source_cache():
+    global _source_cache
+    with _source_cache_lock:
+        if _source_cache is None:
+            _source_cache = SourceCache(SOURCE_CACHE_DIR, SOURCE_CACHE_MAX_BYTES, s3_client)
+        return _source_cache
@@ -0,0 +1,95 @@
+import bisect
+from transcribe import transcribe_videos
+
+
+# formats a time the way AWS Transcribe does in its items
+def _format_time(seconds):
+    return f"{seconds:.3f}"
+
+
+def stitch_transcripts(segment_transcripts):
+    """
+    Merge per-segment AWS Transcribe results into a single transcript on the original
+    video's timeline. segment_transcripts is an iterable of (segment_info, transcript_json)
+    pairs; every word item is shifted by segment_info['start_time'] and tagged with its
+    segment_index. The result keeps the AWS JSON shape, so cherrypick and captions can
+    consume it unchanged, and adds a 'segments' index of where each segment starts.
+    """
+    ordered = sorted(segment_transcripts, key=lambda pair: pair[0]['start_time'])
+
+    items = []
+    texts = []
+    segments = []
+
+    for segment_info, transcript_json in ordered:
+        offset = float(segment_info['start_time'])
+        segment_index = segment_info.get('segment_index', len(segments))
+        first_item = len(items)
+
+        results = transcript_json.get('results', {}) if transcript_json else {}
+        for item in results.get('items', []):
+            stitched_item = dict(item)
+            if 'start_time' in item:
+                stitched_item['start_time'] = _format_time(float(item['start_time']) + offset)
+                stitched_item['end_time'] = _format_time(float(item['end_time']) + offset)
+            stitched_item['segment_index'] = segment_index
+            items.append(stitched_item)
+
+        text = results.get('transcripts', [{}])[0].get('transcript', '')
+        if text:
+            texts.append(text)
+
+        segments.append({
+            'segment_index': segment_index,
+            's3_key': segment_info.get('s3_key'),
+            'start_time': offset,
+            'duration': float(segment_info['duration']),
+            'first_item': first_item,
+            'item_count': len(items) - first_item
+        })
+
+    return {
+        'results': {
+            'transcripts': [{'transcript': ' '.join(texts)}],
+            'items': items
+        },
+        'segments': segments
+    }
+
+
+# finds the segment of a stitched transcript (or upload manifest) that contains time t
+def segment_at(stitched, t):
+    starts = [segment['start_time'] for segment in stitched['segments']]
+    position = bisect.bisect_right(starts, t) - 1
+    if position < 0:
+        return None
+    return stitched['segments'][position]
+
+
+# maps an interval on the original timeline to (segment, local_start, local_end) pieces,
+# so a clip that crosses a segment boundary can be cut from both segments
+def locate_interval(stitched, start_time, end_time):
+    pieces = []
+    for segment in stitched['segments']:
+        segment_start = segment['start_time']
+        segment_end = segment_start + segment['duration']
+        if segment_end <= start_time or segment_start >= end_time:
+            continue
+        pieces.append((
+            segment,
+            max(start_time, segment_start) - segment_start,
+            min(end_time, segment_end) - segment_start
+        ))
+    return pieces
+
+
+# transcribes every segment listed in an upload manifest concurrently and stitches the results
+def transcribe_and_stitch(manifest, **kwargs):
+    segments = [segment for segment in manifest['segments'] if segment.get('audio_uri')]
+    transcripts = transcribe_videos([segment['audio_uri'] for segment in segments], **kwargs)
+
+    stitched = stitch_transcripts(
+        (segment, transcripts.get(segment['audio_uri'])) for segment in segments
+    )
+    stitched['video_id'] = manifest.get('video_id')
+    return stitched
@@ -1,11 +1,17 @@
 import boto3
 import time
+import random
+import asyncio
 import json
 import urllib.request
 import os
 from dotenv import load_dotenv
 import re
 import datetime 
+import uuid
+import threading
+from botocore.exceptions import ClientError, BotoCoreError
+from cache import DiskCache, make_cache_key
 
 # Load .env variables
 load_dotenv()
@@ -13,20 +19,114 @@ load_dotenv()
 AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY")
 AWS_SECRET_ACCESS_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY")
 transcribe = boto3.client('transcribe', region_name='us-east-1', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
+s3_client = boto3.client('s3', region_name='us-east-1', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+                         endpoint_url=os.environ.get("S3_ENDPOINT_URL"))
 
-def transcribe_video(media_uri):
-    # Create a job name from the file name
+# custom language model to transcribe with, 'default' uses the standard Transcribe model
+TRANSCRIBE_MODEL = os.environ.get("TRANSCRIBE_MODEL", "default")
+
+_transcript_cache = None
+_transcript_cache_lock = threading.Lock()
+
+# transcripts are cached by media content hash, language and model
+# TRANSCRIPT_CACHE_BUCKET adds an S3 tier shared between machines
+# the cache directory is only created on first use, not on import
+def get_transcript_cache():
+    global _transcript_cache
+    with _transcript_cache_lock:
+        if _transcript_cache is None:
+            _transcript_cache = DiskCache(
+                os.environ.get("TRANSCRIPT_CACHE_DIR", os.path.join("transcripts", "cache")),
+                max_bytes=int(os.environ.get("TRANSCRIPT_CACHE_MAX_BYTES", 512 * 1024 * 1024)),
+                s3_client=s3_client,
+                s3_bucket=os.environ.get("TRANSCRIPT_CACHE_BUCKET"),
+                s3_prefix="transcript-cache/"
+            )
+        return _transcript_cache
+
+# Transcribe media formats by file extension, audio proxies are flac or ogg/opus
+MEDIA_FORMATS = {
+    'mp4': 'mp4',
+    'm4a': 'mp4',
+    'flac': 'flac',
+    'ogg': 'ogg',
+    'opus': 'ogg',
+    'wav': 'wav',
+    'mp3': 'mp3',
+    'webm': 'webm',
+}
+
+def get_media_format(media_uri):
+    extension = media_uri.rsplit('.', 1)[-1].lower()
+    return MEDIA_FORMATS.get(extension, 'mp4')
+
+# content hash of an S3 media object, the sha256 recorded at upload time or else its ETag
+def media_hash(media_uri, s3=None):
+    bucket, key = media_uri.split('://', 1)[1].split('/', 1)
+    response = (s3 or s3_client).head_object(Bucket=bucket, Key=key)
+    return response.get('Metadata', {}).get('sha256') or response['ETag'].strip('"')
+
+# cache key for a transcript, or None when the media cannot be hashed (missing credentials,
+# no connection, a fake S3), in which case the transcript is simply not cached
+def transcript_cache_key(media_uri, language_code, model, s3=None):
+    try:
+        return make_cache_key(media_hash(media_uri, s3), language_code, model)
+    except (ClientError, BotoCoreError, ValueError, KeyError, IndexError) as e:
+        print(f"Could not hash {media_uri}, transcript will not be cached: {e}")
+        return None
+
+# arguments for start_transcription_job
+def job_arguments(job_name, media_uri, language_code, model):
+    arguments = {
+        'TranscriptionJobName': job_name,
+        'Media': {'MediaFileUri': media_uri},
+        'MediaFormat': get_media_format(media_uri),
+        'LanguageCode': language_code
+    }
+    if model != 'default':
+        arguments['ModelSettings'] = {'LanguageModelName': model}
+    return arguments
+
+# builds a Transcribe job name from the media file name plus a timestamp and a random suffix,
+# so the same file name under different prefixes or submitted twice in a second never collides
+def make_job_name(media_uri):
     original_name = media_uri.split("/")[-1].split(".")[0]
     timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-    job_name = re.sub(r'[^0-9a-zA-Z._-]', '_', original_name) + '_' + timestamp
+    return f"{re.sub(r'[^0-9a-zA-Z._-]', '_', original_name)}_{timestamp}_{uuid.uuid4().hex[:8]}"
+
+# downloads the transcript JSON produced by a completed job
+def fetch_transcript(transcript_uri):
+    response = urllib.request.urlopen(transcript_uri)
+    return json.loads(response.read().decode('utf-8'))
+
+# Store this data in a json file in a folder ./transcripts
+def save_transcript(transcript_data, job_name):
+    transcript_folder = "transcripts"
+    if not os.path.exists(transcript_folder):
+        os.makedirs(transcript_folder)
+    
+    # Save the full transcript data to a file
+    output_file = os.path.join(transcript_folder, f"{job_name}.json")
+    with open(output_file, 'w') as f:
+        json.dump(transcript_data, f, indent=4)
+    
+    print(f"Transcript saved to {output_file}")
+    return output_file
+
+def transcribe_video(media_uri, language_code='en-US', model=TRANSCRIBE_MODEL):
+    # Skip the job entirely if identical media was already transcribed
+    cache_key = transcript_cache_key(media_uri, language_code, model)
+    if cache_key is not None:
+        cached = get_transcript_cache().get(cache_key)
+        if cached is not None:
+            print(f"Using cached transcript for {media_uri}")
+            return cached
+    
+    # Create a job name from the file name
+    job_name = make_job_name(media_uri)
     
     # Start the transcription job
-    transcribe.start_transcription_job(
-        TranscriptionJobName=job_name,
-        Media={'MediaFileUri': media_uri},
-        MediaFormat='mp4',
-        LanguageCode='en-US'
-    )
+    transcribe.start_transcription_job(**job_arguments(job_name, media_uri, language_code, model))
     
     # Wait for the job to complete
     while True:
@@ -43,8 +143,7 @@ def transcribe_video(media_uri):
     
     # Get the transcript URL and download the content
     transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
-    response = urllib.request.urlopen(transcript_uri)
-    transcript_data = json.loads(response.read().decode('utf-8'))
+    transcript_data = fetch_transcript(transcript_uri)
     
     print("Transcription completed successfully.")
     
@@ -52,19 +151,113 @@ def transcribe_video(media_uri):
     transcript_text = transcript_data['results']['transcripts'][0]['transcript']
     print(f"Transcript: {transcript_text[:100]}...")  
     
-    # Store this data in a json file in a folder ./transcripts
-    transcript_folder = "transcripts"
-    if not os.path.exists(transcript_folder):
-        os.makedirs(transcript_folder)
-    
-    # Save the full transcript data to a file
-    output_file = os.path.join(transcript_folder, f"{original_name}_{timestamp}.json")
-    with open(output_file, 'w') as f:
-        json.dump(transcript_data, f, indent=4)
+    try:
+        save_transcript(transcript_data, job_name)
+    except OSError as e:
+        print(f"Could not save the transcript of {media_uri}: {e}")
     
-    print(f"Transcript saved to {output_file}")
+    if cache_key is not None:
+        get_transcript_cache().put(cache_key, transcript_data)
     
     return transcript_data
 
+# runs one job of a batch: submit, poll with exponential backoff and jitter, then download
+async def _transcribe_one(media_uri, semaphore, client, fetch, cache, s3, language_code, model, initial_poll,
+                          max_poll):
+    # cache hits never take an in-flight slot, a failing lookup only means the job runs uncached
+    cache_key = None
+    if cache is not None and s3 is not None:
+        try:
+            cache_key = await asyncio.to_thread(transcript_cache_key, media_uri, language_code, model, s3)
+            if cache_key is not None:
+                cached = await asyncio.to_thread(cache.get, cache_key)
+                if cached is not None:
+                    return media_uri, cached
+        except Exception as e:
+            print(f"Transcript cache lookup failed for {media_uri}: {e}")
+            cache_key = None
+    
+    async with semaphore:
+        job_name = make_job_name(media_uri)
+        
+        try:
+            await asyncio.to_thread(
+                client.start_transcription_job,
+                **job_arguments(job_name, media_uri, language_code, model)
+            )
+            
+            delay = initial_poll
+            while True:
+                # jitter keeps concurrent jobs from polling in lockstep
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                status = await asyncio.to_thread(client.get_transcription_job, TranscriptionJobName=job_name)
+                job_status = status['TranscriptionJob']['TranscriptionJobStatus']
+                if job_status in ['COMPLETED', 'FAILED']:
+                    break
+                delay = min(delay * 2, max_poll)
+            
+            if job_status == 'FAILED':
+                print(f"Transcription failed for {media_uri}: {status['TranscriptionJob'].get('FailureReason', 'Unknown reason')}")
+                return media_uri, None
+            
+            transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
+            transcript_data = await asyncio.to_thread(fetch, transcript_uri)
+        except Exception as e:
+            print(f"Transcription error for {media_uri}: {e}")
+            return media_uri, None
+    
+    # the transcript is already in hand, a failed local copy must not lose it
+    try:
+        await asyncio.to_thread(save_transcript, transcript_data, job_name)
+    except OSError as e:
+        print(f"Could not save the transcript of {media_uri}: {e}")
+    if cache_key is not None:
+        try:
+            await asyncio.to_thread(cache.put, cache_key, transcript_data)
+        except Exception as e:
+            print(f"Could not cache the transcript of {media_uri}: {e}")
+    return media_uri, transcript_data
+
+async def transcribe_batch(media_uris, max_in_flight=10, language_code='en-US', model=TRANSCRIBE_MODEL,
+                           client=None, fetch=None, cache='default', s3=None, initial_poll=2.0, max_poll=30.0):
+    """
+    Submit a transcription job for every media URI at once (at most max_in_flight running)
+    and yield (media_uri, transcript_data) pairs in completion order.
+    transcript_data is None for jobs that failed.
+    client and fetch default to the boto3 Transcribe client and fetch_transcript,
+    and can be replaced with a local fake of the Transcribe API.
+    s3 is the client the media is hashed with for the cache key. It defaults to the boto3
+    S3 client only when client is not replaced, so a fake Transcribe client runs uncached
+    unless a matching fake S3 client is passed too. cache 'default' is the shared transcript
+    cache, pass cache=None to bypass it.
+    """
+    if cache == 'default':
+        cache = get_transcript_cache()
+    if s3 is None and client is None:
+        s3 = s3_client
+    client = client or transcribe
+    fetch = fetch or fetch_transcript
+    semaphore = asyncio.Semaphore(max_in_flight)
+    
+    # each URI is transcribed once even if it is listed twice
+    tasks = [
+        asyncio.ensure_future(_transcribe_one(uri, semaphore, client, fetch, cache, s3, language_code, model,
+                                              initial_poll, max_poll))
+        for uri in dict.fromkeys(media_uris)
+    ]
+    
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+# blocking wrapper around transcribe_batch, returns {media_uri: transcript_data}
+def transcribe_videos(media_uris, **kwargs):
+    async def collect():
+        return {uri: data async for uri, data in transcribe_batch(media_uris, **kwargs)}
+    return asyncio.run(collect())
+
 
-# transcribe_video("s3://uploaded-clips/video_1744604377/segment_000.mp4")
\ No newline at end of file
+# transcribe_video("s3://uploaded-clips/audio/video_1744604377_segment_000.flac")
\ No newline at end of file
@@ -0,0 +1,191 @@
+import os
+import json
+import numpy as np
+
+
+# file names used by Transcript.save / Transcript.load
+ARRAY_FIELDS = ('start', 'end', 'confidence', 'token_ids', 'is_punctuation')
+VOCAB_FILE = 'vocab.json'
+
+
+class Transcript:
+    """
+    Array-backed AWS Transcribe result, parsed once instead of re-reading the nested JSON.
+    Every item (word or punctuation) is a row in parallel arrays: float64 start/end times,
+    float32 confidence, an interned token id into vocab and a punctuation mask.
+    Punctuation items carry the end time of the word before them so the time arrays stay sorted.
+    """
+
+    def __init__(self, start, end, confidence, token_ids, is_punctuation, vocab, text=''):
+        self.start = start
+        self.end = end
+        self.confidence = confidence
+        self.token_ids = token_ids
+        self.is_punctuation = is_punctuation
+        self.vocab = vocab
+        self.text = text
+        self._word_positions = None
+        self._word_starts = None
+
+    @classmethod
+    def from_aws_json(cls, transcript_json):
+        results = transcript_json['results']
+        items = results['items']
+        count = len(items)
+
+        start = np.empty(count, dtype=np.float64)
+        end = np.empty(count, dtype=np.float64)
+        confidence = np.zeros(count, dtype=np.float32)
+        token_ids = np.empty(count, dtype=np.int32)
+        is_punctuation = np.zeros(count, dtype=bool)
+
+        vocab = []
+        vocab_ids = {}
+        last_end = 0.0
+
+        for i, item in enumerate(items):
+            alternative = item['alternatives'][0]
+            content = alternative['content']
+
+            token_id = vocab_ids.get(content)
+            if token_id is None:
+                token_id = vocab_ids[content] = len(vocab)
+                vocab.append(content)
+            token_ids[i] = token_id
+
+            if 'start_time' in item:
+                start[i] = float(item['start_time'])
+                end[i] = last_end = float(item['end_time'])
+            else:
+                start[i] = end[i] = last_end
+            is_punctuation[i] = item['type'] == 'punctuation'
+            confidence[i] = float(alternative.get('confidence') or 0.0)
+
+        text = results.get('transcripts', [{}])[0].get('transcript', '')
+        return cls(start, end, confidence, token_ids, is_punctuation, vocab, text)
+
+    # accepts either a Transcript or raw AWS Transcribe JSON
+    @classmethod
+    def coerce(cls, transcript):
+        if isinstance(transcript, cls):
+            return transcript
+        return cls.from_aws_json(transcript)
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def token(self, i):
+        return self.vocab[self.token_ids[i]]
+
+    # item contents as strings, optionally lowercased for matching
+    def tokens(self, lower=False):
+        vocab = [word.lower() for word in self.vocab] if lower else self.vocab
+        return [vocab[token_id] for token_id in self.token_ids.tolist()]
+
+    # subset of items by index array or boolean mask, sharing the vocabulary
+    def take(self, selection):
+        return Transcript(
+            self.start[selection],
+            self.end[selection],
+            self.confidence[selection],
+            self.token_ids[selection],
+            self.is_punctuation[selection],
+            self.vocab
+        )
+
+    # the pronunciation items only
+    def words_only(self):
+        return self.take(~self.is_punctuation)
+
+    # items from i to j (exclusive) joined as display text, punctuation attached to the word before it
+    def text_between(self, i, j):
+        parts = []
+        for token_id, punctuation in zip(self.token_ids[i:j].tolist(), self.is_punctuation[i:j].tolist()):
+            if punctuation and parts:
+                parts[-1] += self.vocab[token_id]
+            else:
+                parts.append(self.vocab[token_id])
+        return ' '.join(parts)
+
+    # the transcript text, rebuilt from the items for slices and other transcripts without a stored text
+    def full_text(self):
+        return self.text or self.text_between(0, len(self))
+
+    # sorted word start times and their item positions, built once on first lookup
+    def _time_index(self):
+        if self._word_positions is None:
+            self._word_positions = np.flatnonzero(~np.asarray(self.is_punctuation))
+            self._word_starts = np.asarray(self.start)[self._word_positions]
+        return self._word_positions, self._word_starts
+
+    # item index of the word starting closest to time t, considering only items at or after lo
+    # ties go to the earlier word, returns None when no word qualifies
+    def nearest_word(self, t, lo=0):
+        positions, starts = self._time_index()
+        first = int(np.searchsorted(positions, lo, side='left'))
+        if first >= len(positions):
+            return None
+
+        k = int(np.searchsorted(starts, t, side='left'))
+        k = max(k, first)
+        best = None
+        for candidate in (k - 1, k):
+            if candidate < first or candidate >= len(positions):
+                continue
+            if best is None or abs(starts[candidate] - t) < abs(starts[best] - t):
+                best = candidate
+        return int(positions[best])
+
+    # item indices of the words starting in [start_time, end_time)
+    def words_between(self, start_time, end_time):
+        positions, starts = self._time_index()
+        i = int(np.searchsorted(starts, start_time, side='left'))
+        j = int(np.searchsorted(starts, end_time, side='left'))
+        return positions[i:j]
+
+    # items whose words start in [start_time, end_time), with the punctuation that follows them
+    def slice_time(self, start_time, end_time):
+        i = int(np.searchsorted(self.start, start_time, side='left'))
+        j = int(np.searchsorted(self.start, end_time, side='left'))
+        # punctuation shares the time of the word before it, so skip any at i that belongs before the slice
+        # and keep any right after j that ends the last word
+        while i < j and self.is_punctuation[i]:
+            i += 1
+        while j < len(self) and self.is_punctuation[j]:
+            j += 1
+        return self.take(slice(i, j))
+
+    # rebuilds the AWS Transcribe JSON shape for code that still expects it
+    def to_aws_json(self):
+        items = []
+        for i in range(len(self)):
+            alternative = {'content': self.token(i), 'confidence': str(float(self.confidence[i]))}
+            if self.is_punctuation[i]:
+                items.append({'type': 'punctuation', 'alternatives': [alternative]})
+            else:
+                items.append({
+                    'type': 'pronunciation',
+                    'start_time': f"{self.start[i]:.3f}",
+                    'end_time': f"{self.end[i]:.3f}",
+                    'alternatives': [alternative]
+                })
+        return {'results': {'transcripts': [{'transcript': self.full_text()}], 'items': items}}
+
+    # writes the arrays as .npy files in a directory so they can be memory-mapped on load
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        for field in ARRAY_FIELDS:
+            np.save(os.path.join(directory, f"{field}.npy"), np.ascontiguousarray(getattr(self, field)))
+        with open(os.path.join(directory, VOCAB_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'vocab': self.vocab, 'text': self.text}, f)
+        return directory
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        arrays = {
+            field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode='r' if mmap else None)
+            for field in ARRAY_FIELDS
+        }
+        with open(os.path.join(directory, VOCAB_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(vocab=meta['vocab'], text=meta.get('text', ''), **arrays)
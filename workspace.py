@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import shutil
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+
+# every job gets its own directory under this root
+WORKSPACE_ROOT = os.environ.get("WORKSPACE_ROOT", os.path.join(tempfile.gettempdir(), "clip_farm_jobs"))
+
+# default disk budget for one job's scratch files
+WORKSPACE_QUOTA_BYTES = int(os.environ.get("WORKSPACE_QUOTA_BYTES", 5 * 1024 * 1024 * 1024))
+
+# a new workspace is refused when the disk holding the root has less free space than this
+WORKSPACE_MIN_FREE_BYTES = int(os.environ.get("WORKSPACE_MIN_FREE_BYTES", 1024 * 1024 * 1024))
+
+# workspaces without a readable owner file are only treated as orphaned once they are this old
+ORPHAN_GRACE_SECONDS = 3600
+
+OWNER_FILE = '.owner.json'
+
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+
+class Workspace:
+    """
+    Scratch directory owned by one job. Files are created through path() so concurrent
+    jobs never share a name, and check_quota() is called between stages to stop a job
+    whose files outgrow its budget.
+    """
+
+    def __init__(self, root, quota_bytes=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+
+    # path for a file inside the workspace, names are plain file names, not paths
+    def path(self, name):
+        if os.path.basename(name) != name or name in ('', '.', '..'):
+            raise ValueError(f"Invalid workspace file name: {name}")
+        return os.path.join(self.root, name)
+
+    def usage(self):
+        total_bytes = 0
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                try:
+                    total_bytes += os.path.getsize(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return total_bytes
+
+    def check_quota(self):
+        if self.quota_bytes is None:
+            return
+        used = self.usage()
+        if used > self.quota_bytes:
+            raise WorkspaceQuotaExceeded(f"Workspace {self.root} uses {used} bytes, over its quota of {self.quota_bytes}")
+
+
+# whether a pid on this host still belongs to a running process
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def recover_orphaned_workspaces(root=WORKSPACE_ROOT):
+    """
+    Remove workspaces left behind by processes that crashed before their cleanup ran.
+    A workspace is orphaned when its owner process on this host is gone, or when it has
+    no readable owner file and is older than ORPHAN_GRACE_SECONDS. Returns the removed paths.
+    """
+    if not os.path.isdir(root):
+        return []
+
+    hostname = socket.gethostname()
+    removed = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not os.path.isdir(path):
+            continue
+        try:
+            with open(os.path.join(path, OWNER_FILE), 'r') as f:
+                owner = json.load(f)
+            # another host's processes cannot be checked from here
+            orphaned = owner['host'] == hostname and not _pid_alive(owner['pid'])
+        except (OSError, ValueError, KeyError):
+            try:
+                orphaned = time.time() - os.path.getmtime(path) > ORPHAN_GRACE_SECONDS
+            except OSError:
+                continue
+
+        if orphaned:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+
+    if removed:
+        print(f"Removed {len(removed)} orphaned workspaces from {root}")
+    return removed
+
+
+_recovered_roots = set()
+_recovered_lock = threading.Lock()
+
+
+@contextmanager
+def job_workspace(prefix='job', quota_bytes=WORKSPACE_QUOTA_BYTES, root=WORKSPACE_ROOT):
+    """
+    Context manager yielding a fresh Workspace that is removed when the block exits,
+    whether it finishes or raises. The first workspace created under a root in this
+    process also sweeps that root for orphans of crashed processes.
+    """
+    os.makedirs(root, exist_ok=True)
+    with _recovered_lock:
+        if root not in _recovered_roots:
+            _recovered_roots.add(root)
+            recover_orphaned_workspaces(root)
+
+    free_bytes = shutil.disk_usage(root).free
+    if free_bytes < WORKSPACE_MIN_FREE_BYTES:
+        raise WorkspaceQuotaExceeded(f"Only {free_bytes} bytes free under {root}, not starting a new job")
+
+    path = tempfile.mkdtemp(prefix=f"{prefix}_", dir=root)
+    with open(os.path.join(path, OWNER_FILE), 'w') as f:
+        json.dump({'pid': os.getpid(), 'host': socket.gethostname(), 'created_at': time.time()}, f)
+
+    try:
+        yield Workspace(path, quota_bytes)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)